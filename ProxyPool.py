@@ -3,50 +3,325 @@
 """
 代理池，实现自动抓取、更新、验证代理。
 """
+import math
 import time
-import json
+import uuid
+import random
+import threading
 
 from . import checker
-from .utils import get_redis, redis_http_usable, redis_https_usable
+from .snapshot import PoolSnapshot, restore_snapshot
+from .migrate import migrate_legacy
+from .watcher import PoolWatcher
+from .lease import Lease, UsageReporter
+from .utils import get_redis, redis_http_https_usable, pool_strategy, pool_fastest_n, pool_weighted_n, pool_wait_poll, \
+    lease_cap, lease_candidates, lease_resample, snapshot_file, lease_ttl, lease_key
+
+# 代理选取策略
+STRATEGIES = ('random', 'fastest', 'weighted')
 
 
 class ProxyPool:
-    def __init__(self):
+    def __init__(self, strategy=pool_strategy, fastest_n=pool_fastest_n, snapshot=False, lease_cap=lease_cap,
+                 maintain=True, snapshot_file=snapshot_file, weighted_n=pool_weighted_n):
+        """初始化代理池，不等待代理抓取和验证，立即返回。
+
+        redis中已有可用代理时直接使用；某协议没有可用代理时先从snapshot_file恢复，恢复的代理由检查器在后台滚动复检。
+        检查器的第一次检查在后台执行，需要等待代理就绪时调用wait_ready。
+
+        :param strategy: 默认的代理选取策略，'random'随机选取，'fastest'从最快的fastest_n个代理中随机选取，
+            'weighted'从最快的weighted_n个代理中按响应时间倒数加权随机选取。
+        :param fastest_n: 'fastest'策略的候选代理数。
+        :param snapshot: 是否在本地缓存可用代理快照，为True时获取代理不需要访问redis，快照在可用代理更新后自动刷新。
+        :param lease_cap: 同一代理同时租出的租约数上限，租约数记录在redis中，包括其他进程租出的租约。
+        :param maintain: 是否在本进程中启动检查器维护代理池；为False时只读取可用代理，代理池由另外的进程
+            （如'python -m proxy_pool.checker'或'python -m proxy_pool.server --maintain'）维护。
+        :param snapshot_file: 可用代理的磁盘快照文件，启动时从中恢复，本进程的检查器为领导者时定期保存，为None时不使用。
+        :param weighted_n: 'weighted'策略的候选代理数，获取的代理数更多时候选代理数为获取的代理数。
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError('unknown strategy: {}'.format(strategy))
+
+        self._strategy = strategy
+        self._fastest_n = fastest_n
+        self._weighted_n = weighted_n
         self._redis = get_redis()
-        self._checker = checker.Checker()
-        self._checker.start()
+        # 旧版本以集合存放的可用队列需要先转换，否则有序集合命令会出错
+        migrate_legacy()
+        restore_snapshot(snapshot_file)
 
-    def is_ready(self):
-        proxies_http_num = self._redis.scard(redis_http_usable)
-        proxies_https_num = self._redis.scard(redis_https_usable)
+        self._checker = None
+        if maintain:
+            self._checker = checker.Checker(snapshot_file=snapshot_file)
+            self._checker.start()
 
-        if proxies_http_num == 0 or proxies_https_num == 0:
-            return False
+        # 监听可用代理更新，唤醒等待可用代理的线程，并刷新本地快照
+        self._watcher = PoolWatcher()
+        self._snapshot = None
+        if snapshot:
+            self._snapshot = PoolSnapshot()
+            self._snapshot.refresh(force=True)
+            self._watcher.add_callback(self._snapshot.refresh)
+        self._watcher.start()
 
-        return True
+        # 本进程的租约释放时唤醒等待租约的线程，其他进程释放的租约由等待超时后重新检查发现
+        self._lease_cap = lease_cap
+        self._lease_cond = threading.Condition()
+        self._reporter = UsageReporter()
+        self._reporter.start()
+
+    def is_ready(self, protocol=None):
+        """是否有可用代理。
+
+        :param protocol: 代理协议，'http'或'https'，为None时要求两种协议都有可用代理。
+        """
+        protocols = redis_http_https_usable if protocol is None else (protocol,)
+
+        if self._snapshot is not None:
+            return all(self._snapshot.proxies(p) for p in protocols)
+
+        pipe = self._redis.pipeline(transaction=False)
+        for p in protocols:
+            pipe.exists(redis_http_https_usable[p])
+        return all(pipe.execute())
+
+    def wait_ready(self, protocol=None, timeout=None):
+        """阻塞直到有可用代理，可用代理更新后会立即被唤醒。
+
+        :param protocol: 代理协议，'http'或'https'，为None时要求两种协议都有可用代理。
+        :param timeout: 最长等待时间，单位秒，为None时一直等待。
+        :return: 是否有可用代理。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = self._watcher.changes
+            if self.is_ready(protocol):
+                return True
+            if not self._wait_change(changes, deadline):
+                return False
 
     def quit_scheduler(self):
-        self._checker.quit_scheduler()
+        if self._checker is not None:
+            self._checker.quit_scheduler()
+        self._watcher.stop()
+        self._reporter.stop()
 
-    @property
-    def http(self):
-        while not self.is_ready():
-            time.sleep(0.5)
+    def get(self, protocol='http', strategy=None, timeout=None):
+        """获取一个代理。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param strategy: 代理选取策略，为None时使用初始化时指定的策略。
+        :param timeout: 没有可用代理时的最长等待时间，单位秒，为None时一直等待。
+        :return: 'ip:port'形式的代理地址。
+        :raise TimeoutError: 超过等待时间仍没有可用代理。
+        """
+        return self.get_many(1, protocol, strategy=strategy, timeout=timeout)[0]
+
+    def get_many(self, n, protocol='http', replace=False, strategy=None, timeout=None):
+        """一次获取多个代理，只需一次redis请求，使用本地快照时不需要访问redis。
+
+        该协议的可用代理为空时会阻塞等待，可用代理更新后会立即被唤醒。
+
+        :param n: 代理个数，必须为正数。
+        :param protocol: 代理协议，'http'或'https'。
+        :param replace: 是否放回抽样，为True时返回的代理可能重复；为False时返回的代理互不相同，可用代理不足n个时返回的代理少于n个。
+        :param strategy: 代理选取策略，为None时使用初始化时指定的策略。
+        :param timeout: 没有可用代理时的最长等待时间，单位秒，为None时一直等待。
+        :return: 'ip:port'形式的代理地址列表。
+        :raise TimeoutError: 超过等待时间仍没有可用代理。
+        """
+        if n <= 0:
+            raise ValueError('n must be positive: {}'.format(n))
+        strategy = self._strategy if strategy is None else strategy
+        if strategy not in STRATEGIES:
+            raise ValueError('unknown strategy: {}'.format(strategy))
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = self._watcher.changes
+            if self._snapshot is not None:
+                proxies = self._sample_snapshot(n, protocol, replace, strategy)
+            else:
+                proxies = self._sample_redis(n, protocol, replace, strategy)
+
+            if proxies:
+                return proxies
+
+            if not self._wait_change(changes, deadline):
+                raise TimeoutError('no {} proxy available'.format(protocol))
+
+    def acquire(self, protocol='http', strategy=None, timeout=None):
+        """租用一个代理，用完后通过租约报告使用结果::
+
+            with pool.acquire() as lease:
+                try:
+                    response = requests.get(url, proxies={'http': 'http://' + lease.proxy}, timeout=5)
+                except requests.RequestException:
+                    lease.failure()
+                else:
+                    lease.success(response.elapsed.total_seconds() * 1000)
+
+        每次抽取lease_candidates个候选代理，选取第一个租约数未达上限的代理；候选代理的租约都已满时重新抽取，
+        每次抽取的候选代理数翻倍，最多lease_resample次，仍没有可租用代理时等待租约释放。租约登记在redis的'proxy_lease:{protocol}:{ip}:{port}'中，
+        多个进程共用同一上限；每个租约lease_ttl秒后到期，避免使用者进程退出前未释放的租约一直占用额度。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param strategy: 代理选取策略，为None时使用初始化时指定的策略。
+        :param timeout: 没有可租用代理时的最长等待时间，单位秒，为None时一直等待。
+        :return: Lease对象。
+        :raise TimeoutError: 超过等待时间仍没有可租用代理。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # 候选代理的租约都已满时重新抽取，每次抽取的候选代理数翻倍，最多抽取lease_resample次，抽不到新的候选代理时才等待
+            tried = set()
+            for i in range(lease_resample):
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                candidates = [proxy for proxy in self.get_many(lease_candidates << i, protocol, strategy=strategy,
+                                                               timeout=remaining) if proxy not in tried]
+                if not candidates:
+                    break
+                for proxy in candidates:
+                    tried.add(proxy)
+                    token = self._take_lease(protocol, proxy)
+                    if token is not None:
+                        return Lease(self, protocol, proxy, token)
+
+            with self._lease_cond:
+                wait = pool_wait_poll
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError('all {} proxies are leased to the cap'.format(protocol))
+                    wait = min(wait, remaining)
+                self._lease_cond.wait(wait)
 
-        proxy_str = self._redis.srandmember(redis_http_usable)
-        proxy = json.loads(proxy_str)
+    def _take_lease(self, protocol, proxy):
+        """代理的租约数未达上限时登记一个租约。
 
-        return '{}:{}'.format(proxy['ip'], proxy['port'])
+        租约以随机标识为成员、到期时间为分值存入有序集合，每次租用前先移除已到期的租约。先登记再检查租约数，
+        超过上限时撤回，因此并发租用时也不会超过上限。被撤回的租用不会延长其他租约的到期时间。
+
+        :return: 租约标识，租约数已达上限时返回None。
+        """
+        key = lease_key(protocol, proxy)
+        token = uuid.uuid4().hex
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(key, '-inf', now)
+        pipe.zadd(key, {token: now + lease_ttl})
+        pipe.zcard(key)
+        # 只用于清理不再租用的代理的键，租约的到期时间由分值决定
+        pipe.expire(key, lease_ttl)
+        if pipe.execute()[2] <= self._lease_cap:
+            return token
+        self._redis.zrem(key, token)
+        return None
+
+    def _release(self, protocol, proxy, token):
+        """租约结束时由Lease调用。"""
+        self._redis.zrem(lease_key(protocol, proxy), token)
+        with self._lease_cond:
+            self._lease_cond.notify_all()
+
+    def report(self, protocol, proxy, ok, latency=None):
+        """报告代理的使用结果，报告在后台批量写入redis，不需要租约也可以调用。
+
+        使用成功且带有响应时间时，代理的分值更新为该响应时间；使用失败时分值增加demote_penalty毫秒，
+        连续失败evict_failures次时代理被移出可用队列。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param proxy: 'ip:port'形式的代理地址。
+        :param ok: 是否使用成功。
+        :param latency: 使用成功时的响应时间，单位毫秒。
+        """
+        self._reporter.add(protocol, proxy, ok, latency)
+
+    def _wait_change(self, changes, deadline):
+        """等待可用代理更新，最多等待pool_wait_poll秒，以防遗漏通知。
+
+        :return: 超过deadline时返回False，否则返回True，调用方应重新检查可用代理。
+        """
+        wait = pool_wait_poll
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            wait = min(wait, remaining)
+
+        self._watcher.wait(changes, wait)
+        return True
+
+    def _sample_redis(self, n, protocol, replace, strategy):
+        key = redis_http_https_usable[protocol]
+
+        if strategy == 'random':
+            # ZRANDMEMBER的count为负数时允许重复
+            proxies = self._redis.zrandmember(key, -n if replace else n)
+        elif strategy == 'fastest':
+            candidates = self._redis.zrange(key, 0, max(self._fastest_n, n) - 1)
+            proxies = _uniform_sample(candidates, n, replace)
+        else:
+            candidates = self._redis.zrange(key, 0, max(self._weighted_n, n) - 1, withscores=True)
+            proxies = _weighted_sample(candidates, n, replace)
+
+        return [address.decode() for address in proxies]
+
+    def _sample_snapshot(self, n, protocol, replace, strategy):
+        proxies = self._snapshot.proxies(protocol)
+
+        if strategy == 'random':
+            return _uniform_sample([address for address, latency in proxies], n, replace)
+        elif strategy == 'fastest':
+            return _uniform_sample([address for address, latency in proxies[:max(self._fastest_n, n)]], n, replace)
+        else:
+            return _weighted_sample(proxies[:max(self._weighted_n, n)], n, replace)
+
+    def iter_proxies(self, protocol='http', batch_size=100, strategy=None):
+        """代理生成器，每次从redis批量取batch_size个代理缓存在本地，用完后再取下一批。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param batch_size: 每批获取的代理个数。
+        :param strategy: 代理选取策略，为None时使用初始化时指定的策略。
+        """
+        while True:
+            yield from self.get_many(batch_size, protocol, strategy=strategy)
+
+    @property
+    def http(self):
+        return self.get('http')
 
     @property
     def https(self):
-        while not self.is_ready():
-            time.sleep(0.5)
+        return self.get('https')
+
+
+def _uniform_sample(proxies, n, replace):
+    if replace:
+        return random.choices(proxies, k=n) if proxies else []
+    return random.sample(proxies, min(n, len(proxies)))
+
+
+def _weighted_sample(proxies, n, replace):
+    """按响应时间的倒数加权抽样。
+
+    :param proxies: (代理, 响应时间)列表。
+    :param n: 抽样个数。
+    :param replace: 是否放回抽样。
+    """
+    if not proxies:
+        return []
 
-        proxy_str = self._redis.srandmember(redis_https_usable)
-        proxy = json.loads(proxy_str)
+    # 响应时间记录为0的代理按1ms计算，避免除零
+    latencies = [max(latency, 1) for address, latency in proxies]
+    if replace:
+        return [address for address, latency in random.choices(proxies, [1 / latency for latency in latencies], k=n)]
 
-        return '{}:{}'.format(proxy['ip'], proxy['port'])
+    # 不放回加权抽样（Efraimidis-Spirakis）：每个代理取随机键u^(1/w)，取键最大的n个。
+    # 1/w为毫秒级响应时间，u^(1/w)会下溢为0，因此在对数空间中比较，键为log(u)/w；u取(0, 1]，避免log(0)
+    keys = [math.log(1 - random.random()) * latency for latency in latencies]
+    chosen = sorted(range(len(proxies)), key=keys.__getitem__, reverse=True)[:n]
+    return [proxies[i][0] for i in chosen]
 
 
 if __name__ == '__main__':
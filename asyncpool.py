@@ -0,0 +1,297 @@
+# coding=utf-8
+
+"""asyncio代理池客户端。
+
+AsyncProxyPool通过redis.asyncio读取可用代理，获取和等待代理都不会阻塞事件循环。它只读取可用代理，不启动检查器，
+可用代理需要由另外的进程（如运行ProxyPool或checker.py的进程）维护。
+"""
+
+import time
+import asyncio
+import logging
+
+import redis
+
+from .ProxyPool import STRATEGIES, _uniform_sample, _weighted_sample
+from .migrate import migrate_legacy
+from .utils import get_async_redis, redis_http_https_usable, redis_http_https_recheck, redis_pool_version, \
+    redis_pool_channel, pool_strategy, pool_fastest_n, pool_weighted_n, pool_check_interval, pool_wait_poll
+
+
+class AsyncPoolWatcher:
+    """PoolWatcher的asyncio版本，在后台任务中监听可用代理更新通知。"""
+
+    def __init__(self, redis_client, check_interval=pool_check_interval):
+        """
+        :param redis_client: redis.asyncio客户端。
+        :param check_interval: 没有收到更新通知时检查版本号的间隔，单位秒。
+        """
+        self._redis = redis_client
+        self._check_interval = check_interval
+        self._logger = logging.getLogger('pool.watcher')
+        self._cond = asyncio.Condition()
+        self._changes = 0
+        self._version = None
+        self._callbacks = []
+        self._stopped = asyncio.Event()
+        self._task = None
+
+    @property
+    def changes(self):
+        """监听器启动以来收到的更新次数，配合wait使用。"""
+        return self._changes
+
+    def add_callback(self, callback):
+        """添加可用代理更新后的回调，回调为协程函数，在监听任务中执行。"""
+        self._callbacks.append(callback)
+
+    def start(self):
+        """在当前事件循环中启动监听任务。"""
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._listen())
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def wait(self, changes, timeout=None):
+        """等待直到更新次数不等于changes，用法与PoolWatcher.wait相同。
+
+        :return: 是否发生了更新。
+        """
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self._changes != changes), timeout)
+            except asyncio.TimeoutError:
+                return False
+            return True
+
+    async def _check_version(self, notified):
+        version = await self._redis.get(redis_pool_version)
+        if not notified and version == self._version:
+            return
+
+        self._version = version
+        for callback in self._callbacks:
+            await callback()
+
+        async with self._cond:
+            self._changes += 1
+            self._cond.notify_all()
+
+    async def _listen(self):
+        pubsub = None
+        last_check = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                    await pubsub.subscribe(redis_pool_channel)
+                    # 订阅之前可能已经错过了通知
+                    await self._check_version(False)
+
+                # 每次最多等待1s，以便及时响应stop
+                message = await pubsub.get_message(timeout=1.0)
+                if message is not None or time.monotonic() - last_check >= self._check_interval:
+                    await self._check_version(message is not None)
+                    last_check = time.monotonic()
+            except redis.exceptions.RedisError:
+                self._logger.warning('pool watcher error, retry later', exc_info=True)
+                pubsub = None
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), self._check_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        if pubsub is not None:
+            await pubsub.aclose()
+
+
+class AsyncProxyPool:
+    """asyncio代理池客户端，接口与ProxyPool一致，方法均为协程::
+
+        async with AsyncProxyPool() as pool:
+            proxy = await pool.get('http')
+    """
+
+    def __init__(self, strategy=pool_strategy, fastest_n=pool_fastest_n, snapshot=False, redis_client=None,
+                 weighted_n=pool_weighted_n):
+        """
+        :param strategy: 默认的代理选取策略，见ProxyPool。
+        :param fastest_n: 'fastest'策略的候选代理数。
+        :param snapshot: 是否在本地缓存可用代理快照，为True时获取代理不需要访问redis，快照在可用代理更新后自动刷新。
+        :param redis_client: redis.asyncio客户端，为None时使用get_async_redis()。
+        :param weighted_n: 'weighted'策略的候选代理数。
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError('unknown strategy: {}'.format(strategy))
+
+        self._strategy = strategy
+        self._fastest_n = fastest_n
+        self._weighted_n = weighted_n
+        self._redis = get_async_redis() if redis_client is None else redis_client
+        self._logger = logging.getLogger('pool.async')
+        self._watcher = AsyncPoolWatcher(self._redis)
+        self._use_snapshot = snapshot
+        self._snapshot = None
+        self._started = False
+
+    async def start(self):
+        """转换旧版本数据、加载快照并启动更新监听，第一次获取代理时会自动调用。"""
+        if self._started:
+            return
+        self._started = True
+        # 转换只在启动时进行一次，使用同步redis客户端，放在线程池中执行以免阻塞事件循环
+        await asyncio.get_running_loop().run_in_executor(None, migrate_legacy)
+        if self._use_snapshot:
+            await self._refresh_snapshot()
+            self._watcher.add_callback(self._refresh_snapshot)
+        self._watcher.start()
+
+    async def close(self):
+        await self._watcher.stop()
+        await self._redis.aclose()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _refresh_snapshot(self):
+        pipe = self._redis.pipeline(transaction=False)
+        for key in redis_http_https_usable.values():
+            pipe.zrange(key, 0, -1, withscores=True)
+        results = await pipe.execute()
+
+        # 整体替换字典，与PoolSnapshot一致
+        self._snapshot = {protocol: [(address.decode(), latency) for address, latency in result]
+                          for protocol, result in zip(redis_http_https_usable, results)}
+        self._logger.info('snapshot refreshed, http: %d, https: %d',
+                          len(self._snapshot['http']), len(self._snapshot['https']))
+
+    async def is_ready(self, protocol=None):
+        """是否有可用代理。
+
+        :param protocol: 代理协议，'http'或'https'，为None时要求两种协议都有可用代理。
+        """
+        await self.start()
+        protocols = redis_http_https_usable if protocol is None else (protocol,)
+
+        if self._snapshot is not None:
+            return all(self._snapshot[p] for p in protocols)
+
+        pipe = self._redis.pipeline(transaction=False)
+        for p in protocols:
+            pipe.exists(redis_http_https_usable[p])
+        return all(await pipe.execute())
+
+    async def stats(self):
+        """返回可用代理统计。
+
+        :return: 字典，'version'为可用代理版本号，'http'和'https'下的'usable'为可用代理数，'due'为已到复检时间的代理数。
+        """
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.get(redis_pool_version)
+        for protocol in redis_http_https_usable:
+            pipe.zcard(redis_http_https_usable[protocol])
+            pipe.zcount(redis_http_https_recheck[protocol], '-inf', now)
+        version, *counts = await pipe.execute()
+
+        stats = {'version': int(version or 0)}
+        for i, protocol in enumerate(redis_http_https_usable):
+            stats[protocol] = {'usable': counts[2 * i], 'due': counts[2 * i + 1]}
+        return stats
+
+    async def wait_ready(self, protocol=None, timeout=None):
+        """等待直到有可用代理，可用代理更新后会立即被唤醒。
+
+        :param protocol: 代理协议，'http'或'https'，为None时要求两种协议都有可用代理。
+        :param timeout: 最长等待时间，单位秒，为None时一直等待。
+        :return: 是否有可用代理。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = self._watcher.changes
+            if await self.is_ready(protocol):
+                return True
+            if not await self._wait_change(changes, deadline):
+                return False
+
+    async def get(self, protocol='http', strategy=None, timeout=None):
+        """获取一个代理，参数见ProxyPool.get。
+
+        :return: 'ip:port'形式的代理地址。
+        :raise TimeoutError: 超过等待时间仍没有可用代理。
+        """
+        return (await self.get_many(1, protocol, strategy=strategy, timeout=timeout))[0]
+
+    async def get_many(self, n, protocol='http', replace=False, strategy=None, timeout=None):
+        """一次获取多个代理，只需一次redis请求，使用本地快照时不需要访问redis，参数见ProxyPool.get_many。
+
+        :return: 'ip:port'形式的代理地址列表。
+        :raise TimeoutError: 超过等待时间仍没有可用代理。
+        """
+        if n <= 0:
+            raise ValueError('n must be positive: {}'.format(n))
+        strategy = self._strategy if strategy is None else strategy
+        if strategy not in STRATEGIES:
+            raise ValueError('unknown strategy: {}'.format(strategy))
+
+        await self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changes = self._watcher.changes
+            if self._snapshot is not None:
+                proxies = self._sample_snapshot(n, protocol, replace, strategy)
+            else:
+                proxies = await self._sample_redis(n, protocol, replace, strategy)
+
+            if proxies:
+                return proxies
+
+            if not await self._wait_change(changes, deadline):
+                raise TimeoutError('no {} proxy available'.format(protocol))
+
+    async def _wait_change(self, changes, deadline):
+        """等待可用代理更新，最多等待pool_wait_poll秒，以防遗漏通知。
+
+        :return: 超过deadline时返回False，否则返回True，调用方应重新检查可用代理。
+        """
+        wait = pool_wait_poll
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            wait = min(wait, remaining)
+
+        await self._watcher.wait(changes, wait)
+        return True
+
+    async def _sample_redis(self, n, protocol, replace, strategy):
+        key = redis_http_https_usable[protocol]
+
+        if strategy == 'random':
+            proxies = await self._redis.zrandmember(key, -n if replace else n)
+        elif strategy == 'fastest':
+            candidates = await self._redis.zrange(key, 0, max(self._fastest_n, n) - 1)
+            proxies = _uniform_sample(candidates, n, replace)
+        else:
+            candidates = await self._redis.zrange(key, 0, max(self._weighted_n, n) - 1, withscores=True)
+            proxies = _weighted_sample(candidates, n, replace)
+
+        return [address.decode() for address in proxies]
+
+    def _sample_snapshot(self, n, protocol, replace, strategy):
+        proxies = self._snapshot[protocol]
+
+        if strategy == 'random':
+            return _uniform_sample([address for address, latency in proxies], n, replace)
+        elif strategy == 'fastest':
+            return _uniform_sample([address for address, latency in proxies[:max(self._fastest_n, n)]], n, replace)
+        else:
+            return _weighted_sample(proxies[:max(self._weighted_n, n)], n, replace)
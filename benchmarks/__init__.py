@@ -0,0 +1,3 @@
+# coding=utf-8
+
+"""性能测试脚本，通过'python -m proxy_pool.benchmarks.<脚本名>'运行。"""
@@ -0,0 +1,20 @@
+# coding=utf-8
+
+"""以较小的规模依次运行所有性能测试：python -m proxy_pool.benchmarks"""
+
+from . import bench_parse, bench_validate, bench_check, bench_checkout, bench_async_checkout, \
+    bench_server, bench_startup
+
+
+def main():
+    bench_parse.main(['--duration', '1'])
+    bench_validate.main(['--proxies', '200'])
+    bench_check.main(['--sizes', '100,200'])
+    bench_checkout.main(['--size', '1000', '--requests', '1000'])
+    bench_async_checkout.main(['--size', '1000', '--requests', '2000'])
+    bench_server.main(['--size', '1000', '--requests', '2000'])
+    bench_startup.main(['--size', '1000'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# coding=utf-8
+
+"""AsyncProxyPool的获取吞吐量测试。
+
+可用队列中预先存入pool size个代理，在一个事件循环中用concurrency个协程并发调用AsyncProxyPool.get，统计各选取策略下每秒获取的代理数。
+用法：python -m proxy_pool.benchmarks.bench_async_checkout [--size 1000] [--requests 5000] [--concurrency 50]
+"""
+
+import time
+import asyncio
+
+from ..ProxyPool import STRATEGIES
+from ..asyncpool import AsyncProxyPool
+from .common import arg_parser, use_redis, async_redis, fake_addresses, fill_pool, Timer
+
+
+async def bench_async_checkout(strategy, snapshot, requests, concurrency):
+    """返回每秒获取的代理数。"""
+    async with AsyncProxyPool(strategy, snapshot=snapshot, redis_client=async_redis()) as pool:
+        async def worker(count):
+            for i in range(count):
+                await pool.get('http')
+
+        with Timer() as timer:
+            await asyncio.gather(*(worker(requests // concurrency) for i in range(concurrency)))
+    return requests // concurrency * concurrency / timer.elapsed
+
+
+def main(argv=None):
+    parser = arg_parser('AsyncProxyPool.get throughput in one event loop')
+    parser.add_argument('--size', type=int, default=1000, help='pool size')
+    parser.add_argument('--requests', type=int, default=5000, help='checkouts per strategy')
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrent coroutines')
+    args = parser.parse_args(argv)
+
+    print('async checkout throughput ({} proxies, {} checkouts, {} coroutines)'.format(
+        args.size, args.requests, args.concurrency))
+    print('  {:<10} {:<9} {:>12}'.format('strategy', 'snapshot', 'gets/s'))
+    use_redis(args.redis)
+    fill_pool(fake_addresses(args.size), recheck_at=time.time() + 86400)
+    for snapshot in (False, True):
+        for strategy in STRATEGIES:
+            rate = asyncio.run(bench_async_checkout(strategy, snapshot, args.requests, args.concurrency))
+            print('  {:<10} {:<9} {:>12.1f}'.format(strategy, str(snapshot), rate))
+
+
+if __name__ == '__main__':
+    main()
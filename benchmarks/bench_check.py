@@ -0,0 +1,56 @@
+# coding=utf-8
+
+"""检查器耗时与代理池规模的关系。
+
+可用队列中预先存入pool size个指向本地假代理的代理，并全部安排为立即复检，分别统计：
+* check：一次Checker._check的耗时，可用代理充足时不会启动爬虫；
+* sweep：不受recheck_rate限速，反复调用Checker._recheck直到所有代理复检完成的耗时。
+
+用法：python -m proxy_pool.benchmarks.bench_check [--sizes 100,500,1000] [--latency 0.05]
+"""
+
+import time
+
+from .. import utils
+from ..checker import Checker
+from .common import arg_parser, use_redis, local_validation, fill_pool, Timer
+
+
+def bench_check(size, latency, failure_rate):
+    """返回(check耗时, sweep耗时, 复检后的可用代理数)，单位秒。"""
+    with local_validation(size, latency, failure_rate) as fake:
+        fill_pool(fake.proxies(), recheck_at=time.time())
+        checker = Checker(snapshot_file=None)
+        try:
+            with Timer() as check:
+                checker._check()
+
+            r = utils.get_redis()
+            with Timer() as sweep:
+                while any(r.zcount(key, '-inf', time.time()) for key in utils.redis_http_https_recheck.values()):
+                    checker._recheck()
+                checker._tester.end()
+                checker._tester.wait()
+            usable = sum(r.zcard(key) for key in utils.redis_http_https_usable.values())
+        finally:
+            checker.quit_scheduler()
+    return check.elapsed, sweep.elapsed, usable
+
+
+def main(argv=None):
+    parser = arg_parser('Checker._check and full recheck wall time vs pool size')
+    parser.add_argument('--sizes', default='100,500,1000', help='comma separated pool sizes')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake proxy latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fake proxy failure rate')
+    args = parser.parse_args(argv)
+
+    print('checker wall time (latency {}s, failure rate {})'.format(args.latency, args.failure_rate))
+    print('  {:>9} {:>10} {:>10} {:>8}'.format('pool size', 'check', 'sweep', 'usable'))
+    for size in map(int, args.sizes.split(',')):
+        use_redis(args.redis)
+        check, sweep, usable = bench_check(size, args.latency, args.failure_rate)
+        print('  {:>9} {:>9.4f}s {:>9.3f}s {:>8}'.format(size, check, sweep, usable))
+
+
+if __name__ == '__main__':
+    main()
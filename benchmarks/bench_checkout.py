@@ -0,0 +1,47 @@
+# coding=utf-8
+
+"""获取代理的延迟测试。
+
+可用队列中预先存入pool size个代理，复检时间安排在测试结束之后，统计各选取策略下ProxyPool.http的单次耗时分位数。
+用法：python -m proxy_pool.benchmarks.bench_checkout [--size 1000] [--requests 2000]
+"""
+
+import time
+
+from ..ProxyPool import ProxyPool, STRATEGIES
+from .common import arg_parser, use_redis, fake_addresses, fill_pool, percentile
+
+
+def bench_checkout(strategy, snapshot, requests):
+    """返回ProxyPool.http的耗时列表，单位毫秒。"""
+    pool = ProxyPool(strategy, snapshot=snapshot, snapshot_file=None)
+    try:
+        latencies = []
+        for i in range(requests):
+            start = time.perf_counter()
+            pool.http
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+    finally:
+        pool.quit_scheduler()
+
+
+def main(argv=None):
+    parser = arg_parser('ProxyPool.http checkout latency p50/p99')
+    parser.add_argument('--size', type=int, default=1000, help='pool size')
+    parser.add_argument('--requests', type=int, default=2000, help='checkouts per strategy')
+    args = parser.parse_args(argv)
+
+    print('checkout latency ({} proxies, {} checkouts)'.format(args.size, args.requests))
+    print('  {:<10} {:<9} {:>9} {:>9}'.format('strategy', 'snapshot', 'p50', 'p99'))
+    use_redis(args.redis)
+    fill_pool(fake_addresses(args.size), recheck_at=time.time() + 86400)
+    for snapshot in (False, True):
+        for strategy in STRATEGIES:
+            latencies = bench_checkout(strategy, snapshot, args.requests)
+            print('  {:<10} {:<9} {:>7.3f}ms {:>7.3f}ms'.format(
+                strategy, str(snapshot), percentile(latencies, 50), percentile(latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
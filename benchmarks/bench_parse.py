@@ -0,0 +1,94 @@
+# coding=utf-8
+
+"""解析器性能测试。
+
+对parser.parsers中的每个解析器，用模拟页面重复执行与Crawler._parse相同的解析流程，统计每秒解析的代理行数。
+指定--processes时，再让所有解析器同时解析，对比在线程中解析和在进程池中解析的合计吞吐量。
+用法：python -m proxy_pool.benchmarks.bench_parse [--rows 100] [--duration 2] [--processes 0]
+"""
+
+import time
+import argparse
+import threading
+
+from lxml import html
+
+from .. import parser as parser_module
+from ..parsepool import ParsePool
+from .pages import render_page
+
+
+def parse_page(parser, page):
+    """解析一个页面，返回解析出的代理行数。"""
+    tree = html.fromstring(page)
+    rows = 0
+    for proxy_data in parser.get_proxies_data(tree):
+        parser.get_proxies(proxy_data)
+        rows += 1
+    return rows
+
+
+def bench_parser(parser, page, duration):
+    """在duration秒内重复解析page，返回每秒解析的代理行数。"""
+    rows = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        rows += parse_page(parser, page)
+    return rows / (time.perf_counter() - start)
+
+
+def bench_concurrent(pool, pages, duration):
+    """每个解析器一个线程，同时通过pool解析各自的页面，模拟多个抓取器同时解析，返回合计每秒解析的代理行数。"""
+    rows = [0] * len(pages)
+    deadline = time.perf_counter() + duration
+
+    def work(i, parser, page):
+        while time.perf_counter() < deadline:
+            proxies, skipped = pool.parse(parser, page, 'utf-8', float('inf'))
+            rows[i] += len(proxies) + skipped
+
+    # 预先启动解析进程，避免计入启动开销
+    for parser, page in pages:
+        pool.parse(parser, page, 'utf-8', float('inf'))
+    start = time.perf_counter()
+    deadline = start + duration
+    threads = [threading.Thread(target=work, args=(i, parser, page)) for i, (parser, page) in enumerate(pages)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    return sum(rows) / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='parse rows/s per parser')
+    parser.add_argument('--rows', type=int, default=100, help='proxy rows per page')
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds per parser')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='also compare concurrent parsing in threads and in a pool of this many processes')
+    args = parser.parse_args(argv)
+
+    print('parse throughput ({} rows per page)'.format(args.rows))
+    for p in parser_module.parsers:
+        page = render_page(p, args.rows)
+        if page is None:
+            print('  {:<12} no canned page'.format(p.name))
+            continue
+        rows = parse_page(p, page)
+        if rows != args.rows:
+            raise SystemExit('{}: parsed {} rows from a page of {}'.format(p.name, rows, args.rows))
+        print('  {:<12} {:>10.0f} rows/s'.format(p.name, bench_parser(p, page, args.duration)))
+
+    if args.processes:
+        pages = [(p, render_page(p, args.rows).encode()) for p in parser_module.parsers if render_page(p) is not None]
+        print('concurrent parse throughput ({} parsers at once)'.format(len(pages)))
+        print('  {:<12} {:>10.0f} rows/s'.format('threads', bench_concurrent(ParsePool(0), pages, args.duration)))
+        pool = ParsePool(args.processes)
+        try:
+            print('  {:<12} {:>10.0f} rows/s'.format('{} procs'.format(args.processes),
+                                                     bench_concurrent(pool, pages, args.duration)))
+        finally:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# coding=utf-8
+
+"""HTTP服务吞吐量测试。
+
+可用队列中预先存入pool size个代理，在本地启动server.create_app创建的服务，用concurrency个协程通过keep-alive连接并发请求/get，
+统计每秒处理的请求数。客户端和服务运行在同一个事件循环中，结果为单进程服务的下限。
+用法：python -m proxy_pool.benchmarks.bench_server [--size 1000] [--requests 5000] [--concurrency 50]
+"""
+
+import time
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from ..asyncpool import AsyncProxyPool
+from ..server import create_app
+from .common import arg_parser, use_redis, async_redis, fake_addresses, fill_pool, Timer
+
+
+async def bench_server(path, requests, concurrency):
+    """返回每秒处理的请求数。"""
+    app = create_app(AsyncProxyPool(snapshot=True, redis_client=async_redis()))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = 'http://127.0.0.1:{}{}'.format(port, path)
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+            async def worker(count):
+                for i in range(count):
+                    async with session.get(url) as response:
+                        response.raise_for_status()
+                        await response.read()
+
+            with Timer() as timer:
+                await asyncio.gather(*(worker(requests // concurrency) for i in range(concurrency)))
+    finally:
+        await runner.cleanup()
+    return requests // concurrency * concurrency / timer.elapsed
+
+
+def main(argv=None):
+    parser = arg_parser('requests/s of the http serving api')
+    parser.add_argument('--size', type=int, default=1000, help='pool size')
+    parser.add_argument('--requests', type=int, default=5000, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrent connections')
+    args = parser.parse_args(argv)
+
+    print('http serving throughput ({} proxies, {} requests, {} connections)'.format(
+        args.size, args.requests, args.concurrency))
+    use_redis(args.redis)
+    fill_pool(fake_addresses(args.size), recheck_at=time.time() + 86400)
+    for path in ('/get', '/get_many?n=10', '/stats'):
+        rate = asyncio.run(bench_server(path, args.requests, args.concurrency))
+        print('  {:<16} {:>9.1f} requests/s'.format(path, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# coding=utf-8
+
+"""ProxyPool启动耗时测试。
+
+统计两种情况下从创建ProxyPool到获取第一个代理的耗时：
+* warm redis：redis中已有pool size个可用代理；
+* snapshot file：redis为空，从磁盘上的快照文件恢复pool size个代理。
+
+两种情况均不等待检查器的第一次检查，复检时间安排在测试结束之后，不会访问外网。
+用法：python -m proxy_pool.benchmarks.bench_startup [--size 1000]
+"""
+
+import os
+import time
+import tempfile
+
+from .. import utils
+from ..ProxyPool import ProxyPool
+from ..snapshot import save_snapshot
+from .common import arg_parser, use_redis, fake_addresses, fill_pool, Timer
+
+
+def bench_startup(snapshot_file=None, maintain=True):
+    """返回(创建ProxyPool的耗时, 获取第一个代理的耗时)，单位秒。"""
+    with Timer() as create:
+        pool = ProxyPool(snapshot_file=snapshot_file, maintain=maintain)
+    try:
+        with Timer() as first:
+            pool.get('http', timeout=0)
+    finally:
+        pool.quit_scheduler()
+    return create.elapsed, first.elapsed
+
+
+def main(argv=None):
+    parser = arg_parser('ProxyPool startup time from a warm redis and from a snapshot file')
+    parser.add_argument('--size', type=int, default=1000, help='pool size')
+    args = parser.parse_args(argv)
+
+    print('startup time ({} proxies)'.format(args.size))
+    print('  {:<14} {:>10} {:>12}'.format('source', 'create', 'first get'))
+    use_redis(args.redis)
+    fill_pool(fake_addresses(args.size), recheck_at=time.time() + 86400)
+    create, first = bench_startup()
+    print('  {:<14} {:>9.4f}s {:>11.4f}s'.format('warm redis', create, first))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'snapshot.json')
+        save_snapshot(path)
+        utils.get_redis().flushdb()
+        # 只读取可用代理，恢复的代理不会被复检
+        create, first = bench_startup(path, maintain=False)
+    print('  {:<14} {:>9.4f}s {:>11.4f}s'.format('snapshot file', create, first))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# coding=utf-8
+
+"""验证器空闲时的CPU占用测试。
+
+启动验证器但不提交任何代理，统计一段时间内进程消耗的CPU时间，并与旧版轮询'Queue.empty()'的工作循环进行对比。
+用法：python -m proxy_pool.benchmarks.bench_tester_idle [秒数]
+"""
+
+import sys
+import time
+import threading
+from queue import Queue
+
+from ..tester import Tester, ValidationService
+
+
+def _measure(duration):
+    """返回duration秒内进程CPU时间占墙上时间的比例。"""
+    cpu_start = time.process_time()
+    time.sleep(duration)
+    return (time.process_time() - cpu_start) / duration
+
+
+def _busy_spin_loop(queue, stop):
+    """旧版Tester._work的等待方式：队列为空时立即重试。"""
+    while not stop.is_set():
+        if queue.empty():
+            continue
+        queue.get()
+
+
+def bench_busy_spin(duration):
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_spin_loop, args=(Queue(), stop))
+    worker.start()
+    try:
+        return _measure(duration)
+    finally:
+        stop.set()
+        worker.join()
+
+
+def bench_tester(mode, duration):
+    service = ValidationService(mode)
+    tester = Tester(5, service=service)
+    tester.start()
+    try:
+        return _measure(duration)
+    finally:
+        tester.end()
+        tester.wait()
+        service.stop()
+
+
+def main(duration=5.0):
+    # 先让解释器和事件循环完成初始化，避免计入启动开销
+    time.sleep(0.1)
+    print('idle cpu usage over {:.1f}s (1.00 = one full core)'.format(duration))
+    print('  busy-spin loop (before):  {:.2f}'.format(bench_busy_spin(duration)))
+    print('  thread service (after):   {:.2f}'.format(bench_tester('thread', duration)))
+    print('  async service (after):    {:.2f}'.format(bench_tester('async', duration)))
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0)
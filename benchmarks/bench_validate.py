@@ -0,0 +1,48 @@
+# coding=utf-8
+
+"""验证吞吐量测试。
+
+启动本地judge和一组假代理，把所有代理提交给Tester，统计从提交到全部验证完成的每秒验证代理数。
+用法：python -m proxy_pool.benchmarks.bench_validate [--proxies 1000] [--latency 0.05] [--failure-rate 0.1]
+"""
+
+import json
+
+from .. import utils
+from ..tester import Tester
+from .common import arg_parser, use_redis, local_validation, Timer
+
+
+def bench_validate(mode, count, latency, failure_rate, test_times):
+    """返回(每秒验证代理数, 验证通过的代理数)。"""
+    r = utils.get_redis()
+    with local_validation(count, latency, failure_rate, mode) as fake:
+        tester = Tester(test_times)
+        tester.start()
+        with Timer() as timer:
+            for proxy in fake.proxies():
+                tester.test(json.dumps(proxy))
+            tester.end()
+            tester.wait()
+    return count / timer.elapsed, r.zcard(utils.redis_http_usable)
+
+
+def main(argv=None):
+    parser = arg_parser('validations/s of Tester against a local judge and fake proxies')
+    parser.add_argument('--proxies', type=int, default=1000, help='number of fake proxies')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake proxy latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='fake proxy failure rate')
+    parser.add_argument('--test-times', type=int, default=5, help='Tester test_times')
+    parser.add_argument('--mode', choices=('thread', 'async'), action='append', help='validation mode (default: both)')
+    args = parser.parse_args(argv)
+
+    print('validation throughput ({} proxies, latency {}s, failure rate {})'.format(
+        args.proxies, args.latency, args.failure_rate))
+    for mode in args.mode or ('thread', 'async'):
+        use_redis(args.redis)
+        rate, usable = bench_validate(mode, args.proxies, args.latency, args.failure_rate, args.test_times)
+        print('  {:<6} {:>8.1f} validations/s, {} usable'.format(mode, rate, usable))
+
+
+if __name__ == '__main__':
+    main()
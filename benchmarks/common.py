@@ -0,0 +1,125 @@
+# coding=utf-8
+
+"""性能测试公用工具：redis替身、judge和假代理、结果统计。"""
+
+import time
+import argparse
+import contextlib
+
+import redis
+
+from .. import utils
+from ..judge import JudgeServer
+from ..harness import FakeProxy
+from ..tester import ValidationService, set_validation_service
+
+
+def arg_parser(description):
+    """返回带有公用参数的命令行解析器。
+
+    --redis：使用指定的redis，如'redis://localhost:6379/15'，该库会被清空；不指定时使用fakeredis。
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--redis', default=None, help='redis url, the database will be flushed (default: fakeredis)')
+    return parser
+
+
+def use_redis(url=None):
+    """把代理池使用的redis替换为url指定的redis或进程内的fakeredis，并清空。
+
+    :param url: redis地址，为None时使用fakeredis。
+    """
+    global _fake_server
+    if url is None:
+        try:
+            import fakeredis
+        except ImportError:
+            raise SystemExit('fakeredis is required to run benchmarks without --redis: pip install fakeredis')
+        _fake_server = fakeredis.FakeServer()
+        utils.redis_pool = redis.ConnectionPool(connection_class=fakeredis.FakeConnection, server=_fake_server)
+    else:
+        _fake_server = None
+        utils.redis_url = url
+        utils.redis_pool = redis.ConnectionPool.from_url(url)
+    utils.get_redis().flushdb()
+
+
+_fake_server = None
+
+
+def async_redis():
+    """返回连接use_redis所指定redis的redis.asyncio客户端，需在事件循环中调用。"""
+    if _fake_server is None:
+        return utils.get_async_redis()
+    import fakeredis
+    return fakeredis.FakeAsyncRedis(server=_fake_server)
+
+
+@contextlib.contextmanager
+def local_validation(count, latency=0.0, failure_rate=0.0, mode=utils.tester_mode, seed=0):
+    """启动本地judge和count个假代理，并把共享验证服务指向本地judge。
+
+    :return: 上下文中返回FakeProxy对象。
+    """
+    with JudgeServer() as judge, FakeProxy(latency, failure_rate, count=count, seed=seed) as fake:
+        service = ValidationService(mode, judge=judge.urls())
+        old = set_validation_service(service)
+        try:
+            yield fake
+        finally:
+            set_validation_service(old)
+            service.stop()
+
+
+def fake_addresses(count):
+    """生成count个不可连接的代理字典，用于只读取代理、不进行验证的测试。"""
+    return [{'ip': '10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255), 'port': 8080, 'protocol': 'http'}
+            for i in range(count)]
+
+
+def fill_pool(proxies, recheck_at=None):
+    """把代理直接存入可用队列，每10个代理中有1个按https协议存入，响应时间取1~1000ms。
+
+    可用代理少于cache_http_number或cache_https_number时检查器会启动爬虫访问外网，此时直接退出。
+
+    :param proxies: 代理字典列表。
+    :param recheck_at: 复检时间，为None时不安排复检。
+    """
+    r = utils.get_redis()
+    pipe = r.pipeline(transaction=False)
+    for i, proxy in enumerate(proxies):
+        protocol = 'https' if i % 10 == 0 else 'http'
+        address = utils.proxy_address(proxy)
+        pipe.zadd(utils.redis_http_https_usable[protocol], {address: i % 1000 + 1})
+        if recheck_at is not None:
+            pipe.zadd(utils.redis_http_https_recheck[protocol], {address: recheck_at})
+    pipe.execute()
+
+    if r.zcard(utils.redis_http_usable) < utils.cache_http_number or \
+            r.zcard(utils.redis_https_usable) < utils.cache_https_number:
+        raise SystemExit('pool too small, the checker would start crawling: need {} http and {} https proxies'.format(
+            utils.cache_http_number, utils.cache_https_number))
+
+
+def percentile(values, q):
+    """返回values的q分位数（最近秩法）。
+
+    :param q: 0~100。
+    """
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values))) - 1))
+    return values[index]
+
+
+class Timer:
+    """计时上下文，退出后elapsed为耗时，单位秒。"""
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self.elapsed = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.perf_counter() - self._start
@@ -0,0 +1,61 @@
+# coding=utf-8
+
+"""各代理网站代理列表页的模拟页面，结构与parser.py中各解析器的xpath对应。"""
+
+import random
+
+
+def _rows(count, seed):
+    rnd = random.Random(seed)
+    for i in range(count):
+        yield ('{}.{}.{}.{}'.format(rnd.randint(1, 223), rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(1, 254)),
+               str(rnd.randint(1024, 65535)),
+               rnd.choice(('HTTP', 'HTTPS')),
+               '{:.1f}'.format(rnd.random() * 6))
+
+
+def _kuai(count, seed):
+    rows = ''.join(
+        '<tr><td data-title="IP">{}</td><td data-title="PORT">{}</td><td>高匿名</td><td>{}</td><td>北京市</td>'
+        '<td>{}秒</td><td>2018-01-01 12:00:00</td></tr>\n'.format(ip, port, protocol, speed)
+        for ip, port, protocol, speed in _rows(count, seed))
+    return ('<html><body><div id="list"><table class="table"><thead><tr><th>IP</th></tr></thead>'
+            '<tbody>\n{}</tbody></table></div></body></html>').format(rows)
+
+
+def _xici(count, seed):
+    rows = ''.join(
+        '<tr class="odd"><td class="country"></td><td>{}</td><td>{}</td><td>\n<a href="/2018-01-01/beijing">北京</a>\n'
+        '</td><td class="country">高匿</td><td>{}</td><td class="country"><div title="{}秒" class="bar"></div></td>'
+        '<td class="country"><div title="0.1秒" class="bar"></div></td><td>1天</td><td>18-01-01 12:00</td></tr>\n'.format(
+            ip, port, protocol, speed)
+        for ip, port, protocol, speed in _rows(count, seed))
+    return '<html><body><table id="ip_list"><tr><th>国家</th></tr>\n{}</table></body></html>'.format(rows)
+
+
+def _coderbusy(count, seed):
+    rows = ''.join(
+        '<tr><td>\n<a href="#">{}</a>\n</td><td>{}</td><td>\n<a href="#">北京</a>\n</td><td>高匿</td><td>HTTP</td>'
+        '<td>电信</td><td>1</td><td>{}</td><td>0</td><td>{}秒</td></tr>\n'.format(
+            ip, port, '<span>√</span>' if protocol == 'HTTPS' else '', speed)
+        for ip, port, protocol, speed in _rows(count, seed))
+    return '<html><body><table><thead><tr><th>IP</th></tr></thead><tbody>\n{}</tbody></table></body></html>'.format(rows)
+
+
+_renderers = {
+    'kuai': _kuai,
+    'xici': _xici,
+    'coderbusy': _coderbusy,
+}
+
+
+def render_page(parser, count=100, seed=0):
+    """生成解析器对应代理网站的列表页。
+
+    :param parser: parser.py中的解析器类。
+    :param count: 页面中的代理行数。
+    :param seed: 随机数种子。
+    :return: 页面html，没有对应模拟页面时返回None。
+    """
+    renderer = _renderers.get(parser.name)
+    return None if renderer is None else renderer(count, seed)
@@ -0,0 +1,59 @@
+# coding=utf-8
+
+"""验证失败代理的缓存。
+
+以(protocol, ip, port)为键在redis中记录验证失败的代理，同一地址的http和https代理分别记录，失败后的一段时间内该代理被视为失效，不再进行验证或使用。失效时间随连续失败次数指数增长：
+第n次连续失败后失效failure_ttl_base * 2^(n-1)秒，最长failure_ttl_max秒；代理验证成功后清除失败记录。
+"""
+
+from .utils import get_redis, redis_failed_prefix, failure_ttl_base, failure_ttl_max
+
+
+class FailureCache:
+    def __init__(self, scope=None):
+        """初始化失败缓存。
+
+        :param scope: 失败记录的作用范围，为None时使用验证器、爬虫和检查器共享的记录；指定后只记录该范围内的失败，
+            如爬虫用某个代理抓取某个代理网站失败，并不代表该代理失效。
+        """
+        self._redis = get_redis()
+        self._prefix = redis_failed_prefix if scope is None else '{}:{}'.format(redis_failed_prefix, scope)
+
+    def _keys(self, protocol, proxy):
+        return ('{}:dead:{}:{}'.format(self._prefix, protocol, proxy),
+                '{}:count:{}:{}'.format(self._prefix, protocol, proxy))
+
+    def is_dead(self, protocol, proxy):
+        """代理是否处于失效期。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param proxy: 'ip:port'形式的代理地址。
+        """
+        return bool(self._redis.exists(self._keys(protocol, proxy)[0]))
+
+    def record_failure(self, protocol, proxy):
+        """记录一次失败，并按连续失败次数设置失效时间。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param proxy: 'ip:port'形式的代理地址。
+        :return: 本次设置的失效时间，单位秒。
+        """
+        dead_key, count_key = self._keys(protocol, proxy)
+
+        pipe = self._redis.pipeline()
+        pipe.incr(count_key)
+        # 失败次数在最长失效时间的两倍内没有再增加，则重新开始计数
+        pipe.expire(count_key, failure_ttl_max * 2)
+        failures = pipe.execute()[0]
+
+        ttl = min(failure_ttl_base * 2 ** (failures - 1), failure_ttl_max)
+        self._redis.set(dead_key, failures, ex=ttl)
+        return ttl
+
+    def record_success(self, protocol, proxy):
+        """清除代理的失败记录。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param proxy: 'ip:port'形式的代理地址。
+        """
+        self._redis.delete(*self._keys(protocol, proxy))
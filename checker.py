@@ -1,111 +1,196 @@
 # coding=utf-8
 
+import json
 import time
 import logging
 import threading
-import itertools
 from queue import Queue
+from datetime import datetime
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from . import crawler
 from . import parser
-from .tester import Tester
-from .utils import redis_http, redis_https, cache_http_number, \
-    cache_https_number, get_redis, redis_http_usable, redis_https_usable
+from .tester import Tester, PRIORITY_RECHECK, SKIP_DEAD
+from .yieldstats import rank_sources
+from .leader import LeaderElection
+from .snapshot import save_snapshot, restore_snapshot
+from .migrate import migrate_legacy
+from .utils import cache_http_number, cache_https_number, get_redis, redis_http_usable, redis_https_usable, \
+    redis_http_https_usable, redis_http_https_recheck, check_interval, recheck_age, recheck_rate, refill_escalate, \
+    ChangeNotifier, refill_timeout, snapshot_file, snapshot_save_interval
 
 
 class Checker:
-    def __init__(self):
+    def __init__(self, elect=True, snapshot_file=snapshot_file):
+        """初始化检查器，不进行检查，第一次检查在start后立即在后台执行。
+
+        :param elect: 是否参与领导者选举。为True时同一redis上的多个检查器中只有领导者抓取和复检代理，其余检查器只参与竞选，
+            领导者退出或失联后由其中一个接替；为False时本检查器总是抓取和复检代理。
+        :param snapshot_file: 是领导者时定期把可用代理保存到该文件，为None时不保存。
+        """
         self._logger = logging.getLogger('pool.checker')
+        self._snapshot_file = snapshot_file
         self._redis = get_redis()
-        self._tester = Tester(5)
+        # 复检的代理都已到期，不能按最近验证过去重
+        self._tester = Tester(5, PRIORITY_RECHECK, dedup=False)
+        self._notifier = ChangeNotifier()
         self.sched = None
 
-        self._crawlers = []
-        for p in parser.parsers:
-            queue = Queue()
-            c = crawler.Crawler(p, queue)
-            worker = threading.Thread(target=c.start)
-            worker.start()
+        # 代理网站名称到(抓取器, 控制队列)的映射，成为领导者后才创建
+        self._crawlers = {}
+        self._prepared = False
+        self._prepare_lock = threading.Lock()
+
+        self._election = None
+        if elect:
+            self._election = LeaderElection('checker')
+            self._election.start()
 
-            self._crawlers.append(queue)
+    @property
+    def is_leader(self):
+        return self._election is None or self._election.is_leader
+
+    def _lead(self):
+        """是领导者时完成初始化并返回True，否则返回False。
+
+        不是领导者时立即竞选一次，领导者主动释放领导权后由下一次复检或检查及时接替，不必等待后台竞选。
+        """
+        if not self.is_leader and not self._election.campaign():
+            return False
 
-        self._check()
+        with self._prepare_lock:
+            if not self._prepared:
+                for p in parser.parsers:
+                    queue = Queue()
+                    c = crawler.Crawler(p, queue)
+                    worker = threading.Thread(target=c.start)
+                    worker.start()
+
+                    self._crawlers[p.name] = (c, queue)
+
+                migrate_legacy()
+                self._sync_recheck()
+                self._tester.start()
+                self._prepared = True
+        return True
 
     def start(self):
+        """启动后台调度，第一次检查立即在后台执行，本方法不等待检查完成。"""
         self.sched = BackgroundScheduler()
-        self.sched.add_job(self._check, 'cron', minute='*/30')
+        self.sched.add_job(self._recheck, 'interval', seconds=1)
+        self.sched.add_job(self._check, 'interval', seconds=check_interval, next_run_time=datetime.now())
+        if self._snapshot_file is not None:
+            self.sched.add_job(self._save_snapshot, 'interval', seconds=snapshot_save_interval)
         self.sched.start()
 
     def quit_scheduler(self):
         # 退出后台程序
-        self.sched.remove_all_jobs()
+        if self.sched is not None:
+            self.sched.remove_all_jobs()
         # 退出爬虫进程
-        [c.put('quit') for c in self._crawlers]
+        [queue.put('quit') for c, queue in self._crawlers.values()]
+        self._save_snapshot()
+        # 释放领导权，其他检查器可以立即接替
+        if self._election is not None:
+            self._election.stop()
         self._logger.info("退出后台程序")
 
+    def _save_snapshot(self):
+        """领导者把可用代理保存到快照文件。"""
+        if not self.is_leader or self._snapshot_file is None:
+            return
+        try:
+            save_snapshot(self._snapshot_file)
+        except OSError:
+            self._logger.warning('save snapshot failed', exc_info=True)
+
     def _check_enough(self):
-        http_enough = self._redis.scard(redis_http) < cache_http_number
-        https_enough = self._redis.scard(redis_https) < cache_https_number
+        """是否有协议的可用代理不足，没有judge、无法验证的协议不计入，抓取也补充不了这些协议的代理。"""
+        http_enough = self._tester.can_test('http') and self._redis.zcard(redis_http_usable) < cache_http_number
+        https_enough = self._tester.can_test('https') and self._redis.zcard(redis_https_usable) < cache_https_number
         return http_enough or https_enough
 
-    def _check(self):
-        """检查可用代理，若数量过少，则更新代理。
-
-        以http代理为例，实际用的代理存放在proxies_http_usable中，开始检查后会将其中的代理送给验证器，验证可用的代理存在proxies_http中，
-        若数量过少会启动爬虫，直到proxies_http中可用代理的数量大于某个值之后，再将proxies_http_usable清空，把刚抓取的代理填充进去。
-        """
-        self._logger.info('start checking proxies')
-        self._tester.start()
-        # 获取当前可用代理
-        proxies_http_usable = set()
-        for proxy in self._redis.sscan_iter(redis_http_usable):
-            proxies_http_usable.add(proxy)
-
-        proxies_https_usable = set()
-        for proxy in self._redis.sscan_iter(redis_https_usable):
-            proxies_https_usable.add(proxy)
-
-        self._logger.info('http proxies number: %d', self._redis.scard(redis_http_usable))
-        self._logger.info('https proxies number: %d', self._redis.scard(redis_https_usable))
+    def _sync_recheck(self):
+        """为还没有复检时间的可用代理安排立即复检，如升级前已存在的可用代理。"""
+        now = time.time()
+        for protocol, key in redis_http_https_usable.items():
+            pipe = self._redis.pipeline(transaction=False)
+            for proxy, latency in self._redis.zscan_iter(key):
+                pipe.zadd(redis_http_https_recheck[protocol], {proxy: now}, nx=True)
+            pipe.execute()
 
-        # 清空检查结果缓存，因为在停止爬虫之后验证器稍后才会退出，因此队列中可能用残留的代理
-        for i in range(self._redis.scard(redis_http)):
-            proxies_http_usable.add(self._redis.spop(redis_http))
+    def _recheck(self):
+        """滚动复检，每次调用为每种协议提交至多recheck_rate个到期的代理，到期早的优先。
 
-        for i in range(self._redis.scard(redis_https)):
-            proxies_https_usable.add(self._redis.spop(redis_https))
+        提交后先把这些代理的到期时间推迟recheck_age秒，避免验证结束前被重复提交；验证通过后验证器会重新设置到期时间，
+        验证失败的代理会被立即移出可用队列；处于失效期、不会被验证的代理（如同一代理的另一次验证刚刚失败）直接移出可用队列和复检队列。
+        没有judge的协议不复检，其可用代理保持不变。只有领导者进行复检。
+        """
+        if not self._lead():
+            return
+
+        now = time.time()
+        for protocol, key in redis_http_https_recheck.items():
+            if not self._tester.can_test(protocol):
+                continue
+            proxies = self._redis.zrangebyscore(key, '-inf', now, start=0, num=recheck_rate)
+            if not proxies:
+                continue
+
+            self._redis.zadd(key, dict.fromkeys(proxies, now + recheck_age), xx=True)
+            dead = []
+            for address in proxies:
+                ip, port = address.decode().rsplit(':', 1)
+                if self._tester.submit(json.dumps({'ip': ip, 'port': port, 'protocol': protocol})) == SKIP_DEAD:
+                    dead.append(address)
+
+            if dead:
+                pipe = self._redis.pipeline(transaction=False)
+                pipe.zrem(key, *dead)
+                pipe.zrem(redis_http_https_usable[protocol], *dead)
+                if pipe.execute()[-1]:
+                    self._notifier.changed()
+                self._logger.info('removed %d dead %s proxies', len(dead), protocol)
 
-        # 对可用代理进行验证
-        for proxy in itertools.chain(proxies_http_usable, proxies_https_usable):
-            self._tester.test(proxy)
-        self._tester.test('end')
+    def _check(self):
+        """检查可用代理数量，若数量过少，则启动爬虫补充代理。
 
-        while not self._tester.is_done():
-            time.sleep(0.5)
+        可用代理由_recheck滚动复检，失效的代理会被立即移除。爬虫抓取的代理验证通过后直接存入可用队列，可用代理数量足够后停止爬虫。
+        爬虫按代理网站的历史产出速度依次启动：已启动的爬虫运行refill_escalate秒后代理仍不足，或者都因产出过低停止了抓取时，
+        再启动下一个。只有领导者进行检查，抓取过程中失去领导权时停止抓取。一次最多抓取refill_timeout秒，代理仍不足时由下一次检查继续补充。
+        """
+        if not self._lead():
+            self._logger.info('not the leader, leader: %s', self._election.leader())
+            return
 
-        self._logger.info('usable http proxies number: %d', self._redis.scard(redis_http))
-        self._logger.info('usable https proxies number: %d', self._redis.scard(redis_https))
+        self._logger.info('http proxies number: %d', self._redis.zcard(redis_http_usable))
+        self._logger.info('https proxies number: %d', self._redis.zcard(redis_https_usable))
 
         # 可用代理数过少，进行更新
         if self._check_enough():
-            [c.put('start') for c in self._crawlers]
-
-            while self._check_enough():
+            waiting = rank_sources(list(self._crawlers))
+            self._logger.info('start crawling proxies, sources: %s', ', '.join(waiting))
+            started = []
+            started_at = 0
+            deadline = time.monotonic() + refill_timeout
+
+            while self._check_enough() and self.is_leader:
+                if time.monotonic() >= deadline:
+                    self._logger.warning('proxies still not enough after crawling %ds', refill_timeout)
+                    break
+                exhausted = all(self._crawlers[name][0].exhausted.is_set() for name in started)
+                if waiting and (exhausted or time.monotonic() - started_at >= refill_escalate):
+                    name = waiting.pop(0)
+                    self._logger.info('start crawler %s', name)
+                    self._crawlers[name][1].put('start')
+                    started.append(name)
+                    started_at = time.monotonic()
                 time.sleep(2)
-            [c.put('end') for c in self._crawlers]
-
-            pipe = self._redis.pipeline()
-            for i in range(self._redis.scard(redis_http_usable)):
-                pipe.spop(redis_http_usable)
-            for proxy in self._redis.sscan_iter(redis_http):
-                pipe.smove(redis_http, redis_http_usable, proxy)
-            for i in range(self._redis.scard(redis_https_usable)):
-                pipe.spop(redis_https_usable)
-            for proxy in self._redis.sscan_iter(redis_https):
-                pipe.smove(redis_https, redis_https_usable, proxy)
-            pipe.execute()
+            [self._crawlers[name][1].put('end') for name in started]
+
+            self._logger.info('usable http proxies number: %d', self._redis.zcard(redis_http_usable))
+            self._logger.info('usable https proxies number: %d', self._redis.zcard(redis_https_usable))
 
 
 if __name__ == '__main__':
@@ -118,5 +203,12 @@ if __name__ == '__main__':
     sh.setFormatter(formatter)
     logger.addHandler(sh)
 
+    migrate_legacy()
+    restore_snapshot(snapshot_file)
     c = Checker()
     c.start()
+    # 检查在后台进行，主线程保持运行直到被中断
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        c.quit_scheduler()
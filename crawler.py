@@ -6,28 +6,65 @@ import re
 import json
 import time
 import logging
+import itertools
 import threading
 from queue import Queue
+from urllib.parse import urlsplit
 
 import requests
-from lxml import html
+from requests.adapters import HTTPAdapter
 
 from . import tester
-from .utils import get_redis, redis_http, redis_https
+from .blacklist import FailureCache
+from .pagecache import PageCache
+from .parsepool import get_parse_pool, PROXY_FIELDS
+from .ratelimit import host_bucket
+from .yieldstats import SourceStats
+from .utils import get_redis, redis_http_usable, redis_https_usable, crawl_concurrency, crawl_timeout, yield_window, \
+    yield_min, crawl_skip_run, address_stats_key
+
+
+def page_urls(index_url):
+    """生成代理网站各页的(页码, url)，页码替换index_url中的最后一个数字，从1开始。"""
+    for page in itertools.count(1):
+        yield page, re.sub(r'\d+(?=\D*$)', str(page), index_url)
 
 
 class Crawler:
     def __init__(self, parser, work_q):
         self._PROXY_NAME = parser.name
-        self._urls_to_crawl = Queue()
-        self._urls_crawled = Queue()
         self._pages_to_parse = Queue()
         self._redis = get_redis()
         self._sentinel = object()  # 抓取终止信号
         self._logger = logging.getLogger('pool.crawler.{}'.format(self._PROXY_NAME))
         self._parser = parser
         self._work_q = work_q
-        self._tester = tester.Tester(5)
+        self._tester = tester.Tester(5, callback=self._on_result)
+        self._failures = FailureCache()
+        # 使用过进行抓取并且无效的代理.某些代理虽然通过了验证，但是使用时仍然可能有问题；另一种情况就是，西刺提供的代理都是无法抓取西刺的
+        self._crawl_failures = FailureCache('crawl:{}'.format(self._PROXY_NAME))
+        self._parse_pool = get_parse_pool()
+        self._page_cache = PageCache()
+        self._bucket = host_bucket(urlsplit(parser.index_url).hostname)
+        self._stop = threading.Event()
+        self._urls = None
+        self._urls_lock = threading.Lock()
+        self._fetchers = []
+
+        # 产出统计。本轮各页的[提交验证数, 验证完毕数, 验证通过数, 解析出的代理数, 被去重的代理数]，解析完成前代理数为None
+        self._stats = SourceStats(parser.name)
+        self._yield_lock = threading.Lock()
+        self._round = 0
+        self._pages = {}
+        # 验证中的代理所属的(轮次, 页码)
+        self._proxy_pages = {}
+        self._started_at = None
+        self._stopped_at = None
+        # 本轮抓取失败的页码，以及判断出的代理列表末页之后的第一个页码
+        self._skipped = set()
+        self._end_page = None
+        # 本轮因产出过低或到达末页停止了抓取
+        self.exhausted = threading.Event()
 
     def start(self):
         """爬虫执行器。
@@ -40,19 +77,39 @@ class Crawler:
             if work == 'start':
                 self._logger.info('crawler start')
                 self._tester.start()
-                self._urls_to_crawl.put(self._parser.index_url)
+                self._stop.clear()
+                self.exhausted.clear()
+                self._urls = page_urls(self._parser.index_url)
+                with self._yield_lock:
+                    self._round += 1
+                    self._pages = {}
+                    self._skipped = set()
+                    self._end_page = None
+                    self._started_at = time.monotonic()
+                    self._stopped_at = None
 
                 session = requests.Session()
                 session.headers = self._parser.headers
+                adapter = HTTPAdapter(pool_maxsize=crawl_concurrency)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
 
-                # 启动抓取和解析线程
-                crawler = threading.Thread(target=self._crawl, args=(session, 3))
+                # 启动解析线程和crawl_concurrency个抓取线程
                 parser = threading.Thread(target=self._parse, args=(5000,))
                 parser.start()
-                crawler.start()
+                self._fetchers = [threading.Thread(target=self._crawl, args=(session, 3))
+                                  for i in range(crawl_concurrency)]
+                [f.start() for f in self._fetchers]
             elif work == 'end':
-                self._urls_to_crawl.put(self._sentinel)
+                if not self._fetchers:
+                    continue
+                # 等待抓取线程退出后再结束解析，保证已抓取的页面都被解析
+                self._stop.set()
+                [f.join() for f in self._fetchers]
+                self._fetchers = []
                 self._pages_to_parse.put(self._sentinel)
+                self._stats.record_crawl_time(self._stopped_at - self._started_at)
+                self.exhausted.clear()
             elif work == 'quit':
                 self._logger.info("main crawler quit")
                 self._logger.info("test is done %s", self._tester.is_done())
@@ -61,8 +118,8 @@ class Crawler:
     def _parse(self, response_times_allow):
         """代理页面解析。
 
-        从待解析队列中取一个页面进行解析，并将响应时间大于response_times_allow值的代理送给代理验证器。
-        解析完该页所有代理后，会再解析出下一页的url，并放入待抓取队列中。
+        从待解析队列中取一个页面进行解析，并将响应时间不大于response_times_allow值的代理送给代理验证器。
+        parse_processes大于0时页面在共享的进程池中解析，本线程只等待解析结果。
 
         :param response_times_allow: 允许的代理响应时间，响应时间低于该值的代理会被过滤掉。
         """
@@ -71,92 +128,173 @@ class Crawler:
             self._logger.debug('get page to parse')
 
             if page_to_parse is self._sentinel:
-                # 停止解析，并清空解析队列
-                with self._pages_to_parse.mutex:
-                    self._pages_to_parse.queue.clear()
-
-                self._tester.test('end')
+                self._tester.end()
                 self._logger.info('parse spider quit')
                 break
 
-            tree = html.fromstring(page_to_parse)
+            page, content, encoding = page_to_parse
+            proxies, skipped = self._parse_pool.parse(self._parser, content, encoding, response_times_allow)
+            self._logger.debug('parsed %d proxies from page %d, skipped %d', len(proxies), page, skipped)
+
+            with self._yield_lock:
+                entry = self._pages.setdefault(page, [0, 0, 0, None, 0])
+                current = self._round
+            submitted = 0
+            deduped = 0
+            for proxy in proxies:
+                proxy = dict(zip(PROXY_FIELDS, proxy))
+                key = (proxy['ip'], proxy['port'], proxy['protocol'])
+                # 先登记所属页面，验证结果可能在test返回前到达
+                with self._yield_lock:
+                    self._proxy_pages[key] = (current, page)
+                self._logger.debug('put proxy to test: %s', proxy)
+                result = self._tester.submit(json.dumps(proxy))
+                if result == tester.SUBMITTED:
+                    submitted += 1
+                else:
+                    deduped += result == tester.SKIP_RECENT
+                    with self._yield_lock:
+                        self._proxy_pages.pop(key, None)
+
+            with self._yield_lock:
+                entry[0] += submitted
+                entry[3] = len(proxies)
+                entry[4] = deduped
+            if not proxies and not skipped:
+                self._mark_end(page)
+            self._stats.record_parsed(page, len(proxies))
+
+    def _record_empty_page(self, page):
+        """记录一个没有新代理的页面，如未修改的页面。"""
+        with self._yield_lock:
+            self._pages[page] = [0, 0, 0, 0, 0]
+        self._stats.record_parsed(page, 0)
+
+    def _mark_end(self, page):
+        """记录代理列表在page之前结束，page及之后的页面不再抓取。"""
+        with self._yield_lock:
+            if self._end_page is None or page < self._end_page:
+                self._end_page = page
+
+    def _record_skipped_page(self, page):
+        """记录一个重试后仍抓取失败的页面，包含该页的连续失败页面达到crawl_skip_run个时，视为已超出代理列表的末页。"""
+        with self._yield_lock:
+            self._skipped.add(page)
+            first = page
+            while first - 1 in self._skipped:
+                first -= 1
+            last = page
+            while last + 1 in self._skipped:
+                last += 1
+        if last - first + 1 >= crawl_skip_run:
+            self._mark_end(first)
+
+    def _on_result(self, proxy, latency):
+        """验证器回调，记录代理所属页面的验证结果。"""
+        with self._yield_lock:
+            source = self._proxy_pages.pop((proxy['ip'], proxy['port'], proxy['protocol']), None)
+            if source is None:
+                return
+            round_, page = source
+            if round_ == self._round and page in self._pages:
+                entry = self._pages[page]
+                entry[1] += 1
+                entry[2] += latency is not None
+        self._stats.record_result(page, latency)
+
+    def _low_yield(self):
+        """最近yield_window个验证完毕的页面中，验证通过的代理占比是否低于yield_min。
+
+        最近验证过而被去重的代理不能说明网站的产出，不计入占比；代理都已去重或页面未修改的页面不计入统计，
+        否则去重有效期内补充代理时，抓取器会在到达后面有新代理的页面之前停止。没有代理行的页面由_mark_end处理。
+        """
+        with self._yield_lock:
+            done = sorted(page for page, (submitted, finished, passed, parsed, deduped) in self._pages.items()
+                          if parsed is not None and parsed > deduped and finished == submitted)
+            if len(done) < yield_window:
+                return False
+            recent = [self._pages[page] for page in done[-yield_window:]]
+        candidates = sum(entry[3] - entry[4] for entry in recent)
+        passed = sum(entry[2] for entry in recent)
+        return passed < yield_min * candidates
+
+    def _is_useless(self, proxy):
+        """作为抓取代理的http代理是否已失效，或最近用于抓取本代理网站失败过。
+
+        :param proxy: 'ip:port'形式的代理地址。
+        """
+        return self._failures.is_dead('http', proxy) or self._crawl_failures.is_dead('http', proxy)
 
-            proxies_data = self._parser.get_proxies_data(tree)
-            for proxy_data in proxies_data:
-                proxies = self._parser.get_proxies(proxy_data)
-                for proxy in proxies:
-                    if proxy['response_times'] <= response_times_allow and proxy['protocol'].lower() in {'http', 'https'}:
-                        self._logger.debug('put proxy to test: %s', proxy)
-                        self._tester.test(json.dumps(proxy))
-                    else:
-                        self._logger.debug('pass proxy: %s', proxy)
-            else:
-                # 本页代理解析完毕，提取下一页url放入待抓取队列
-                current_page_number = int(re.match(r'.*?(\d+).*?', self._urls_crawled.get()).group(1))
-                next_url_to_crawl = re.sub(r'(\d+)', str(current_page_number + 1), self._parser.index_url)
-                self._logger.debug('put url to crawl: %s', next_url_to_crawl)
-                self._urls_to_crawl.put(next_url_to_crawl)
+    def _next_url(self):
+        with self._urls_lock:
+            return next(self._urls)
 
     def _crawl(self, session, retry_count_limit):
         """代理页面抓取。
 
-        从待抓取队列中取一个url进行抓取，并将抓取结果放入待解析队列。当某页抓取失败时，会进行重试，最大重试次数为retry_count_limit，超过
-        该值时会跳过此url。
-        每个url抓取间隔为0.5s。
+        每个抓取线程依次取下一页的url进行抓取，并将抓取结果放入待解析队列，同一网站的多个抓取线程并发抓取不同页面。当某页抓取失败时，会进行
+        重试，最大重试次数为retry_count_limit，超过该值时会跳过此url。
+        每次请求前从域名对应的令牌桶中取一个令牌，限制对同一网站的请求速率。
+        请求时带上页面缓存中的条件请求头部，未修改或内容与上次相同的页面不会被解析。
+        最近验证完毕的页面产出过低时停止抓取，后面的页面多为失效代理；到达代理列表的末页后也停止抓取。
 
         :param session: requests session。
         :param retry_count_limit: 抓取重试次数，某个页面抓取失败时会进行重试，当重试次数超过该值时会跳过此url。
         """
+        while not self._stop.is_set():
+            if self._end_page is not None:
+                if not self.exhausted.is_set():
+                    self._logger.info('no proxies from page %d on, stop crawling', self._end_page)
+                self.exhausted.set()
+                break
 
-        # 使用过进行抓取并且无效的代理.某些代理虽然通过了验证，但是使用时仍然可能有问题；另一种情况就是，西刺提供的代理都是无法抓取西刺的
-        proxies_used_useless = set()
-        while True:
-            url_to_crawl = self._urls_to_crawl.get()
-            self._logger.debug('get url to crawl: %s', url_to_crawl)
-
-            if url_to_crawl is self._sentinel:
-                # 停止抓取，并清空抓取队列
-                with self._urls_to_crawl.mutex:
-                    self._urls_to_crawl.queue.clear()
+            if self._low_yield():
+                if not self.exhausted.is_set():
+                    self._logger.info('yield of recent pages is below %s, stop crawling', yield_min)
+                self.exhausted.set()
+                break
 
-                with self._urls_crawled.mutex:
-                    self._urls_crawled.queue.clear()
+            page, url_to_crawl = self._next_url()
+            self._logger.debug('get url to crawl: %s', url_to_crawl)
 
-                self._logger.info('crawl spider quit')
-                break
+            for retry_count in range(retry_count_limit + 1):
+                if not self._bucket.acquire(self._stop):
+                    break
 
-            retry_count = 0
-            while True:
-                proxy_str = self._redis.spop(redis_http)
-                if proxy_str:
-                    self._redis.sadd(redis_http, proxy_str)
-                    proxy = json.loads(proxy_str)
-                    p = '{}:{}'.format(proxy['ip'], proxy['port'])
+                p = next(iter(self._redis.zrandmember(redis_http_usable, 1)), None)
+                if p:
+                    p = p.decode()
+                    src = self._redis.hget(address_stats_key('http', p), 'src')
+                use_proxy = p and src != self._parser.name.encode() and not self._is_useless(p)
 
+                headers = self._page_cache.headers(url_to_crawl)
                 try:
-                    if proxy_str and (p not in proxies_used_useless) and proxy['src'] != self._parser.name:
+                    if use_proxy:
                         self._logger.debug('use proxy to crawl proxies: %s', p)
-                        r = session.get(url_to_crawl, proxies={'http': p}, timeout=5)
-                        r.raise_for_status()
+                        r = session.get(url_to_crawl, headers=headers, proxies={'http': p}, timeout=crawl_timeout)
                     else:
                         self._logger.debug('use local ip to crawl proxies')
-                        r = session.get(url_to_crawl, timeout=5)
-                        r.raise_for_status()
+                        r = session.get(url_to_crawl, headers=headers, timeout=crawl_timeout)
+                    r.raise_for_status()
                 except requests.exceptions.RequestException:
-                    if retry_count < retry_count_limit:
-                        retry_count += 1
-
-                        if proxy_str and proxy['src'] != self._parser.name:
-                            self._logger.warning('proxy %s is useless', p)
-                            proxies_used_useless.add(p)
-                    else:
-                        time.sleep(5)
+                    if use_proxy:
+                        self._logger.warning('proxy %s is useless', p)
+                        self._crawl_failures.record_failure('http', p)
                 else:
-                    self._logger.debug('put page to parse')
-                    self._pages_to_parse.put(r.text)
-                    self._urls_crawled.put(url_to_crawl)
-                    time.sleep(1)
+                    if self._page_cache.update(url_to_crawl, r):
+                        self._logger.debug('put page to parse')
+                        self._pages_to_parse.put((page, r.content, r.encoding))
+                    else:
+                        self._logger.debug('page not modified: %s', url_to_crawl)
+                        self._record_empty_page(page)
                     break
+            else:
+                self._logger.warning('skip url after %d retries: %s', retry_count_limit, url_to_crawl)
+                self._record_skipped_page(page)
+
+        with self._yield_lock:
+            self._stopped_at = max(self._stopped_at or 0, time.monotonic())
+        self._logger.info('crawl spider quit')
 
 
 if __name__ == '__main__':
@@ -181,20 +319,18 @@ if __name__ == '__main__':
 
     q.put('start')
 
-    l_http = r.scard(redis_http)
-    l_https = r.scard(redis_https)
+    l_http = r.zcard(redis_http_usable)
+    l_https = r.zcard(redis_https_usable)
     while l_http < 5 or l_https < 5:
         time.sleep(0.01)
-        l_http = r.scard(redis_http)
-        l_https = r.scard(redis_https)
+        l_http = r.zcard(redis_http_usable)
+        l_https = r.zcard(redis_https_usable)
 
     q.put('end')
     print(l_http)
-    for proxy in r.sscan_iter(redis_http):
-        p = json.loads(proxy)
-        print('{}:{}'.format(p['ip'], p['port']), end=', ')
+    for proxy, latency in r.zscan_iter(redis_http_usable):
+        print(proxy.decode(), end=', ')
     print()
     print(l_https)
-    for proxy in r.sscan_iter(redis_https):
-        p = json.loads(proxy)
-        print('{}:{}'.format(p['ip'], p['port']), end=', ')
+    for proxy, latency in r.zscan_iter(redis_https_usable):
+        print(proxy.decode(), end=', ')
@@ -0,0 +1,49 @@
+# coding=utf-8
+
+"""待验证代理去重。
+
+以(ip, port, protocol)为键在redis中记录最近验证过的代理及验证结果，键在dedup_ttl秒后过期。过期前再次提交的同一代理不会再被验证，
+无论上次验证通过、失败还是正在验证中。验证通过的代理已经在可用队列中，并由检查器按时复检。
+"""
+
+from .utils import get_redis, redis_seen_prefix, dedup_ttl
+
+# 最近一次验证结果
+PENDING = b'pending'
+PASSED = b'1'
+FAILED = b'0'
+
+
+class Deduplicator:
+    def __init__(self, ttl=dedup_ttl):
+        """初始化去重器。
+
+        :param ttl: 验证记录的保留时间，单位秒。
+        """
+        self._redis = get_redis()
+        self._ttl = ttl
+
+    @staticmethod
+    def _key(proxy):
+        return '{}:{}:{}:{}'.format(redis_seen_prefix, proxy['protocol'].lower(), proxy['ip'], proxy['port'])
+
+    def claim(self, proxy):
+        """登记一个待验证代理。
+
+        :param proxy: 待验证代理字典。
+        :return: 代理最近未被验证过时返回None，调用方应进行验证；否则返回PENDING、PASSED或FAILED。
+        """
+        key = self._key(proxy)
+        if self._redis.set(key, PENDING, nx=True, ex=self._ttl):
+            return None
+
+        # 记录恰好在两次命令之间过期时按正在验证处理，丢弃本次提交
+        return self._redis.get(key) or PENDING
+
+    def record(self, proxy, ok):
+        """记录代理的验证结果。
+
+        :param proxy: 已验证代理字典。
+        :param ok: 是否验证通过。
+        """
+        self._redis.set(self._key(proxy), PASSED if ok else FAILED, ex=self._ttl)
@@ -0,0 +1,100 @@
+# coding=utf-8
+
+"""本地假代理，用于离线测试和性能测试验证流程。
+
+FakeProxy是一个最简的http代理，支持绝对地址的GET请求转发和CONNECT隧道，可以设置响应延迟和失败率，
+配合judge.JudgeServer即可在不访问外网的情况下验证代理。一个FakeProxy可以同时监听多个端口，每个端口相当于一个代理，
+所有端口共用一个事件循环线程。
+"""
+
+import random
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from .judge import BackgroundServer, read_request, http_response
+
+
+class FakeProxy(BackgroundServer):
+    """本地假代理。"""
+    _logger = logging.getLogger('pool.harness')
+
+    def __init__(self, latency=0.0, failure_rate=0.0, host='127.0.0.1', port=0, count=1, seed=None):
+        """
+        :param latency: 每个请求转发前的延迟，单位秒。
+        :param failure_rate: 请求失败的概率，失败时直接断开连接。
+        :param port: 第一个代理的端口，其余代理的端口由系统分配。
+        :param count: 代理个数，即监听的端口数。
+        :param seed: 随机数种子，用于复现失败序列。
+        """
+        super().__init__(host, port)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._count = count
+        self._ports = []
+        self._random = random.Random(seed)
+
+    def proxy(self, protocol='http'):
+        """返回第一个代理的代理字典。"""
+        return {'ip': self._host, 'port': self._port, 'protocol': protocol}
+
+    def proxies(self, protocol='http'):
+        """返回所有代理的代理字典列表。"""
+        return [{'ip': self._host, 'port': port, 'protocol': protocol} for port in self._ports]
+
+    async def _listen(self):
+        servers = []
+        for i in range(self._count):
+            server = await asyncio.start_server(self._serve, self._host, self._port if i == 0 else 0)
+            self._ports.append(server.sockets[0].getsockname()[1])
+            servers.append(server)
+        self._port = self._ports[0]
+        self._logger.info('%d fake proxies listening on %s', self._count, self._host)
+        return servers
+
+    async def _handle(self, reader, writer):
+        request = await read_request(reader)
+        if request is None:
+            return
+        method, target, headers = request
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            return
+
+        if method == 'CONNECT':
+            host, _, port = target.rpartition(':')
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+            writer.write(b'HTTP/1.1 200 Connection Established\r\n\r\n')
+            await asyncio.gather(self._pipe(reader, upstream_writer), self._pipe(upstream_reader, writer))
+            return
+
+        url = urlsplit(target)
+        if not url.hostname:
+            writer.write(http_response(400, 'Bad Request'))
+            await writer.drain()
+            return
+        upstream_reader, upstream_writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        headers = {name: value for name, value in headers.items()
+                   if name.lower() not in ('proxy-connection', 'connection', 'keep-alive')}
+        headers['Connection'] = 'close'
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        head = '{} {} HTTP/1.1\r\n'.format(method, path)
+        head += ''.join('{}: {}\r\n'.format(name, value) for name, value in headers.items())
+        upstream_writer.write((head + '\r\n').encode('latin-1'))
+        await self._pipe(upstream_reader, writer)
+        upstream_writer.close()
+
+    @staticmethod
+    async def _pipe(reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
@@ -0,0 +1,220 @@
+# coding=utf-8
+
+"""代理验证用的判定服务（judge）。
+
+验证器通过代理请求judge，judge返回请求来源地址，验证器据此判断代理是否可用且为高匿代理。默认使用httpbin.org，
+也可以用本模块的JudgeServer在本地或内网部署一个低延迟的judge，返回格式与'http://httpbin.org/get'相同：
+{"origin": "来源ip", "headers": {...}}。
+
+https代理需要通过CONNECT隧道和judge建立TLS连接才能验证其是否支持https，因此JudgeServer提供了证书时会在另一个端口上
+提供https服务，没有证书时只能用于验证http代理。证书可以是自签名证书，此时需要把utils.judge_verify设为False。
+
+用法：python -m proxy_pool.judge [端口] [--tls-port 端口 --certfile 证书 --keyfile 私钥]
+"""
+
+import ssl
+import json
+import asyncio
+import logging
+import argparse
+import threading
+
+from .utils import judge_port, judge_tls_port
+
+
+def check_origin(proxy, status, body):
+    """默认的响应校验函数：状态码200，并且返回的json内容中'origin'字段值和代理地址一致。
+
+    :param proxy: 待验证代理字典。
+    :param status: 响应状态码。
+    :param body: 响应内容，bytes。
+    :return: 校验通过返回True。
+    """
+    if status != 200:
+        return False
+    try:
+        return json.loads(body)['origin'] == proxy['ip']
+    except (ValueError, KeyError, TypeError):
+        return False
+
+
+async def read_request(reader):
+    """读取一个http请求的请求行和头部。
+
+    :return: (method, target, headers)，连接已关闭或请求格式错误时返回None。
+    """
+    try:
+        request_line = await reader.readline()
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip()] = value.strip()
+    except (ValueError, ConnectionError):
+        return None
+    return method, target, headers
+
+
+def http_response(status, reason, body=b'', content_type='application/json'):
+    """构造一个短连接的http响应。"""
+    head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+        status, reason, content_type, len(body))
+    return head.encode('latin-1') + body
+
+
+class BackgroundServer:
+    """在独立线程的事件循环中运行的asyncio tcp服务，子类实现_handle处理每个连接。"""
+    _logger = logging.getLogger('pool.server')
+
+    def __init__(self, host='127.0.0.1', port=0):
+        """
+        :param host: 监听地址。
+        :param port: 监听端口，0表示由系统分配。
+        """
+        self._host = host
+        self._port = port
+        self._loop = None
+        self._servers = []
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._port
+
+    def start(self):
+        """启动服务，监听成功后返回。"""
+        if self._thread is not None:
+            return self
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """停止服务并等待后台线程退出。"""
+        if self._thread is None:
+            return
+        for server in self._servers:
+            self._loop.call_soon_threadsafe(server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._servers = self._loop.run_until_complete(self._listen())
+        ready.set()
+        self._loop.run_forever()
+
+    async def _listen(self):
+        """开始监听，返回asyncio server列表。"""
+        server = await asyncio.start_server(self._serve, self._host, self._port)
+        self._port = server.sockets[0].getsockname()[1]
+        self._logger.info('%s listening on %s:%d', type(self).__name__, self._host, self._port)
+        return [server]
+
+    async def _serve(self, reader, writer):
+        try:
+            await self._handle(reader, writer)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        raise NotImplementedError
+
+
+class JudgeServer(BackgroundServer):
+    """轻量的asyncio judge服务，对任意GET请求返回请求来源地址和请求头。"""
+    _logger = logging.getLogger('pool.judge')
+
+    def __init__(self, host='127.0.0.1', port=0, certfile=None, keyfile=None, tls_port=0):
+        """
+        :param host: 监听地址。
+        :param port: http服务的监听端口，0表示由系统分配。
+        :param certfile: https服务的证书文件，为None时不提供https服务。
+        :param keyfile: 证书的私钥文件，为None时从certfile中读取。
+        :param tls_port: https服务的监听端口，0表示由系统分配。
+        """
+        super().__init__(host, port)
+        self._certfile = certfile
+        self._keyfile = keyfile
+        self._tls_port = tls_port
+
+    @property
+    def tls_port(self):
+        """https服务的端口，没有提供https服务时为None。"""
+        return self._tls_port if self._certfile else None
+
+    def url(self, host=None):
+        """返回http服务的地址，只能用于验证http代理。
+
+        :param host: 验证器访问judge使用的地址，默认为监听地址。
+        """
+        return 'http://{}:{}/get'.format(host or self._host, self._port)
+
+    def urls(self, host=None):
+        """返回可用作judge_url的各协议地址，没有提供https服务时只有http地址，https代理不会被验证。
+
+        :param host: 验证器访问judge使用的地址，默认为监听地址。
+        :return: 字典，键为协议，值为judge地址。
+        """
+        urls = {'http': self.url(host)}
+        if self._certfile:
+            urls['https'] = 'https://{}:{}/get'.format(host or self._host, self._tls_port)
+        return urls
+
+    async def _listen(self):
+        servers = await super()._listen()
+        if self._certfile:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(self._certfile, self._keyfile)
+            server = await asyncio.start_server(self._serve, self._host, self._tls_port, ssl=context)
+            self._tls_port = server.sockets[0].getsockname()[1]
+            self._logger.info('%s serving https on %s:%d', type(self).__name__, self._host, self._tls_port)
+            servers.append(server)
+        return servers
+
+    async def _handle(self, reader, writer):
+        request = await read_request(reader)
+        if request is None:
+            return
+        method, target, headers = request
+        if method != 'GET':
+            writer.write(http_response(405, 'Method Not Allowed'))
+        else:
+            body = json.dumps({'origin': writer.get_extra_info('peername')[0], 'headers': headers})
+            writer.write(http_response(200, 'OK', body.encode()))
+        await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve a judge for proxy validation')
+    parser.add_argument('port', type=int, nargs='?', default=judge_port)
+    parser.add_argument('--tls-port', type=int, default=judge_tls_port)
+    parser.add_argument('--certfile', help='certificate for the https judge, https is not served without it')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args(argv)
+
+    server = JudgeServer('0.0.0.0', args.port, args.certfile, args.keyfile, args.tls_port).start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
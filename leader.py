@@ -0,0 +1,114 @@
+# coding=utf-8
+
+"""基于redis的领导者选举。
+
+多个进程竞选同一名称的领导权，领导者持有'proxy_leader:{name}'键，值为本进程的标识，过期时间为ttl。领导者每隔ttl/3秒续约一次，
+续约失败或无法确认时立即放弃领导权；领导者进程退出时主动释放，失联时键过期，其他进程在下一次竞选时接替。
+续约和释放先确认键的值仍为本进程的标识，使用WATCH事务实现，不依赖lua脚本。
+"""
+
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+
+import redis
+
+from .utils import get_redis, redis_leader_prefix, leader_ttl
+
+
+class LeaderElection:
+    def __init__(self, name, ttl=leader_ttl):
+        """
+        :param name: 领导权名称，竞选同一名称的进程中只有一个领导者。
+        :param ttl: 领导权的有效时间，单位秒，领导者失联后最多ttl秒由其他进程接替。
+        """
+        self._redis = get_redis()
+        self._key = '{}:{}'.format(redis_leader_prefix, name)
+        self._ttl = ttl
+        self.identity = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self._logger = logging.getLogger('pool.leader')
+        # 领导权在本地的到期时间，续约线程被阻塞时也不会在键过期后仍自认为是领导者
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._worker = None
+
+    @property
+    def is_leader(self):
+        return time.monotonic() < self._expires_at
+
+    def leader(self):
+        """返回当前领导者的标识，没有领导者时返回None。"""
+        identity = self._redis.get(self._key)
+        return None if identity is None else identity.decode()
+
+    def start(self):
+        """竞选一次，并启动后台线程定期竞选或续约。"""
+        self._stopped.clear()
+        self.campaign()
+        self._worker = threading.Thread(target=self._run)
+        self._worker.setDaemon(True)
+        self._worker.start()
+
+    def stop(self):
+        """停止后台线程，是领导者时释放领导权。"""
+        self._stopped.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        with self._lock:
+            if not self.is_leader:
+                return
+            self._expires_at = 0
+            try:
+                self._redis.transaction(self._release, self._key)
+                self._logger.info('%s released leadership of %s', self.identity, self._key)
+            except redis.exceptions.RedisError:
+                self._logger.warning('release leadership failed', exc_info=True)
+
+    def campaign(self):
+        """是领导者时续约，否则尝试成为领导者，可以在后台线程之外调用。
+
+        :return: 是否为领导者。
+        """
+        with self._lock:
+            return self._campaign()
+
+    def _campaign(self):
+        was_leader = self.is_leader
+        # 以发出请求前的时间计算到期时间，本地到期不晚于redis中的键
+        start = time.monotonic()
+        try:
+            if was_leader:
+                leading = self._redis.transaction(self._renew, self._key, value_from_callable=True)
+            else:
+                leading = bool(self._redis.set(self._key, self.identity, nx=True, px=int(self._ttl * 1000)))
+        except redis.exceptions.RedisError:
+            self._logger.warning('leader election failed', exc_info=True)
+            leading = False
+
+        self._expires_at = start + self._ttl if leading else 0
+        if leading and not was_leader:
+            self._logger.info('%s became the leader of %s', self.identity, self._key)
+        elif was_leader and not leading:
+            self._logger.warning('%s lost leadership of %s', self.identity, self._key)
+        return leading
+
+    def _run(self):
+        while not self._stopped.wait(self._ttl / 3):
+            self.campaign()
+
+    def _renew(self, pipe):
+        if pipe.get(self._key) != self.identity.encode():
+            return False
+        pipe.multi()
+        pipe.pexpire(self._key, int(self._ttl * 1000))
+        return True
+
+    def _release(self, pipe):
+        if pipe.get(self._key) == self.identity.encode():
+            pipe.multi()
+            pipe.delete(self._key)
@@ -0,0 +1,178 @@
+# coding=utf-8
+
+"""代理租约与使用反馈。
+
+使用者通过ProxyPool.acquire租用代理，用完后报告使用结果（成功与否和响应时间）。报告先缓存在本地，由后台线程每隔
+report_flush_interval秒或缓存满report_batch条时通过一次pipeline批量写入redis：
+* 成功且带有响应时间时，把可用队列中该代理的分值更新为报告的响应时间；
+* 失败时把分值增加demote_penalty毫秒，降低其在'fastest'和'weighted'策略中被选中的机会；
+* 连续失败evict_failures次时立即把代理移出可用队列和复检队列，并记入失败缓存。
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+from .blacklist import FailureCache
+from .utils import get_redis, address_stats_key, redis_http_https_usable, redis_http_https_recheck, \
+    report_flush_interval, report_batch, demote_penalty, evict_failures, stats_ttl, ChangeNotifier
+
+
+class Lease:
+    """一次代理租约，报告使用结果或释放后结束。可作为上下文管理器使用，退出时若尚未报告则只释放、不报告。"""
+
+    def __init__(self, pool, protocol, proxy, token):
+        """
+        :param pool: 租出代理的ProxyPool。
+        :param protocol: 代理协议，'http'或'https'。
+        :param proxy: 'ip:port'形式的代理地址。
+        :param token: 租约在redis中的标识。
+        """
+        self.protocol = protocol
+        self.proxy = proxy
+        self.token = token
+        self.acquired_at = time.monotonic()
+        self._pool = pool
+        self._done = False
+
+    def report(self, ok, latency=None):
+        """报告使用结果并结束租约，重复报告会被忽略。
+
+        :param ok: 是否使用成功。
+        :param latency: 使用成功时的响应时间，单位毫秒，为None时不更新代理的分值。
+        """
+        if self.release():
+            self._pool.report(self.protocol, self.proxy, ok, latency)
+
+    def success(self, latency=None):
+        self.report(True, latency)
+
+    def failure(self):
+        self.report(False)
+
+    def release(self):
+        """不报告结果，直接结束租约。
+
+        :return: 本次调用是否结束了租约，租约已结束时返回False。
+        """
+        if self._done:
+            return False
+        self._done = True
+        self._pool._release(self.protocol, self.proxy, self.token)
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __repr__(self):
+        return '<Lease {}://{}>'.format(self.protocol, self.proxy)
+
+
+class UsageReporter:
+    """在后台线程中批量写入代理使用报告。"""
+
+    def __init__(self, flush_interval=report_flush_interval, batch=report_batch):
+        """
+        :param flush_interval: 写入间隔，单位秒。
+        :param batch: 缓存的报告达到batch条时立即写入。
+        """
+        self._redis = get_redis()
+        self._flush_interval = flush_interval
+        self._batch = batch
+        self._logger = logging.getLogger('pool.lease')
+        self._failures = FailureCache()
+        self._notifier = ChangeNotifier()
+        self._reports = deque()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+
+    def start(self):
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self._run)
+        self._worker.setDaemon(True)
+        self._worker.start()
+
+    def stop(self):
+        """停止后台线程，并写入剩余的报告。"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.flush()
+
+    def add(self, protocol, proxy, ok, latency=None):
+        """缓存一条使用报告。
+
+        :param protocol: 代理协议，'http'或'https'。
+        :param proxy: 'ip:port'形式的代理地址。
+        :param ok: 是否使用成功。
+        :param latency: 使用成功时的响应时间，单位毫秒。
+        """
+        self._reports.append((protocol, proxy, ok, latency))
+        if len(self._reports) >= self._batch:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self._logger.exception('flush usage reports failed')
+
+    def flush(self):
+        """把缓存的报告写入redis。
+
+        :return: 本次被移出可用队列的代理数。
+        """
+        reports = []
+        while self._reports:
+            reports.append(self._reports.popleft())
+        if not reports:
+            return 0
+
+        now = int(time.time())
+        pipe = self._redis.pipeline(transaction=False)
+        failed = []  # 失败报告的代理，以及其连续失败次数在pipeline结果中的位置
+        for protocol, proxy, ok, latency in reports:
+            key = address_stats_key(protocol, proxy)
+            usable = redis_http_https_usable[protocol]
+            pipe.hincrby(key, 'uses', 1)
+            pipe.hset(key, 'used_at', now)
+            if ok:
+                pipe.hset(key, 'use_fail_streak', 0)
+                if latency is not None:
+                    # 只更新仍在可用队列中的代理，不把已移除的代理重新加入
+                    pipe.zadd(usable, {proxy: latency}, xx=True)
+            else:
+                pipe.hincrby(key, 'use_failures', 1)
+                failed.append((protocol, proxy, len(pipe)))
+                pipe.hincrby(key, 'use_fail_streak', 1)
+                pipe.zadd(usable, {proxy: demote_penalty}, xx=True, incr=True)
+            # 报告可能来自任意地址，统计需要过期，不能一直留在redis中
+            pipe.expire(key, stats_ttl)
+        results = pipe.execute()
+
+        evicted = {(protocol, proxy) for protocol, proxy, index in failed if results[index] >= evict_failures}
+        if evicted:
+            pipe = self._redis.pipeline(transaction=False)
+            for protocol, proxy in evicted:
+                pipe.hset(address_stats_key(protocol, proxy), mapping={'streak': 0, 'use_fail_streak': 0})
+                pipe.zrem(redis_http_https_recheck[protocol], proxy)
+                pipe.zrem(redis_http_https_usable[protocol], proxy)
+            removed = sum(pipe.execute()[2::3])
+
+            for protocol, proxy in evicted:
+                self._logger.info('evict %s://%s after %d failed uses', protocol, proxy, evict_failures)
+                self._failures.record_failure(protocol, proxy)
+            if removed:
+                self._notifier.changed()
+            return removed
+        return 0
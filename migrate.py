@@ -0,0 +1,77 @@
+# coding=utf-8
+
+"""旧版本redis数据的升级。
+
+旧版本的可用队列'proxies_http_usable'、'proxies_https_usable'以及待转移队列'proxies_http'、'proxies_https'都是集合，成员为代理字典的
+json字符串。新版本的可用队列是以'ip:port'为成员、响应时间为分值的有序集合，对集合执行有序集合命令会返回WRONGTYPE错误，
+因此读取或写入可用队列的进程启动时先调用migrate_legacy进行转换：
+* 代理以'ip:port'存入可用队列，旧数据没有实测响应时间，分值记为0；
+* 代理安排立即复检，由检查器验证后更新响应时间，失效的代理会被移除；
+* 来源网站、所在地等代理信息存入验证统计。
+
+每个旧集合在一个WATCH事务中读取、删除并写入新队列，多个进程同时启动时只有一个进程完成转换。
+"""
+
+import json
+import time
+import logging
+
+import redis
+
+from .tester import PROXY_INFO_FIELDS
+from .utils import get_redis, redis_http_https_usable, redis_http_https_recheck, proxy_address, address_stats_key, \
+    stats_ttl
+
+# 旧版本的待转移队列，验证通过的代理先存入这里，再由检查器转移到可用队列
+LEGACY_PENDING = {'http': 'proxies_http', 'https': 'proxies_https'}
+
+
+def migrate_legacy():
+    """把旧版本以集合存放的可用队列和待转移队列转换为新的可用队列和复检队列。
+
+    :return: 转换的代理数。
+    """
+    r = get_redis()
+    logger = logging.getLogger('pool.migrate')
+    migrated = 0
+    for protocol, usable in redis_http_https_usable.items():
+        # 先转换可用队列本身，之后可用队列才能接收待转移队列中的代理
+        for key in (usable, LEGACY_PENDING[protocol]):
+            if r.type(key) != b'set':
+                continue
+            try:
+                count = r.transaction(lambda pipe: _convert(pipe, key, protocol), key, value_from_callable=True)
+            except redis.exceptions.ResponseError:
+                # 其他进程已经转换完毕，可用队列已是有序集合
+                logger.warning('migrate %s failed', key, exc_info=True)
+                continue
+            if count:
+                logger.info('migrated %d proxies from %s', count, key)
+                migrated += count
+    return migrated
+
+
+def _convert(pipe, key, protocol):
+    if pipe.type(key) != b'set':
+        return 0
+
+    proxies = {}
+    for member in pipe.smembers(key):
+        try:
+            proxy = json.loads(member)
+            proxies[proxy_address(proxy)] = proxy
+        except (ValueError, TypeError, KeyError):
+            continue
+
+    now = time.time()
+    pipe.multi()
+    pipe.delete(key)
+    if proxies:
+        pipe.zadd(redis_http_https_usable[protocol], dict.fromkeys(proxies, 0), nx=True)
+        pipe.zadd(redis_http_https_recheck[protocol], dict.fromkeys(proxies, now), nx=True)
+        for address, proxy in proxies.items():
+            info = {field: proxy[field] for field in PROXY_INFO_FIELDS if proxy.get(field) is not None}
+            if info:
+                pipe.hset(address_stats_key(protocol, address), mapping=info)
+                pipe.expire(address_stats_key(protocol, address), stats_ttl)
+    return len(proxies)
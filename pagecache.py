@@ -0,0 +1,58 @@
+# coding=utf-8
+
+"""代理网站页面缓存。
+
+以url为键在redis中记录页面的ETag、Last-Modified和内容的sha1。再次抓取同一页面时带上If-None-Match和If-Modified-Since，
+服务器返回304或者页面内容与上次相同时，该页面不再解析，其中的代理也不会再次送去验证。
+"""
+
+import hashlib
+
+from .utils import get_redis, redis_page_prefix, page_cache_ttl
+
+
+class PageCache:
+    def __init__(self):
+        self._redis = get_redis()
+
+    @staticmethod
+    def _key(url):
+        return '{}:{}'.format(redis_page_prefix, url)
+
+    def headers(self, url):
+        """返回抓取url时需要附加的条件请求头部。"""
+        etag, last_modified = self._redis.hmget(self._key(url), 'etag', 'last_modified')
+
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag.decode()
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified.decode()
+        return headers
+
+    def update(self, url, response):
+        """根据抓取结果更新缓存。
+
+        :param url: 页面url。
+        :param response: requests的响应对象。
+        :return: 页面有变化、需要解析时返回True；服务器返回304或内容与上次相同时返回False。
+        """
+        key = self._key(url)
+        if response.status_code == 304:
+            self._redis.expire(key, page_cache_ttl)
+            return False
+
+        digest = hashlib.sha1(response.content).hexdigest()
+        changed = self._redis.hget(key, 'sha1') != digest.encode()
+
+        mapping = {'sha1': digest}
+        for field, header in (('etag', 'ETag'), ('last_modified', 'Last-Modified')):
+            if header in response.headers:
+                mapping[field] = response.headers[header]
+
+        pipe = self._redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, page_cache_ttl)
+        pipe.execute()
+        return changed
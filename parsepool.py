@@ -0,0 +1,97 @@
+# coding=utf-8
+
+"""代理页面解析，可选在进程池中进行。
+
+页面解析（html.fromstring和xpath提取）需要持有GIL，在线程中进行时会和验证线程争用。parse_processes大于0时，抓取器把原始页面
+交给共享的进程池解析，进程间只传递页面bytes和解析出的代理元组，不传递lxml对象。
+"""
+
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+from lxml import html
+
+from .utils import parse_processes
+
+# 解析结果元组中各字段的顺序
+PROXY_FIELDS = ('ip', 'port', 'address', 'protocol', 'src', 'response_times')
+
+
+def parse_page(parser, content, encoding, response_times_allow):
+    """解析一个代理页面。
+
+    :param parser: parser.py中的解析器类。
+    :param content: 页面原始内容，bytes。
+    :param encoding: 页面编码，为None时由lxml根据页面声明判断。
+    :param response_times_allow: 允许的代理响应时间，响应时间高于该值的代理会被过滤掉。
+    :return: (代理元组列表, 被过滤的代理数)，代理元组字段顺序见PROXY_FIELDS。
+    """
+    tree = html.fromstring(content.decode(encoding, 'replace') if encoding else content)
+
+    proxies = []
+    skipped = 0
+    for proxy_data in parser.get_proxies_data(tree):
+        for proxy in parser.get_proxies(proxy_data):
+            if proxy['response_times'] <= response_times_allow and proxy['protocol'].lower() in {'http', 'https'}:
+                proxies.append(tuple(proxy[field] for field in PROXY_FIELDS))
+            else:
+                skipped += 1
+    return proxies, skipped
+
+
+class ParsePool:
+    _logger = logging.getLogger('pool.parsepool')
+
+    def __init__(self, processes=parse_processes):
+        """
+        :param processes: 解析进程数，为0时在调用线程中解析。
+        """
+        self._processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def parse(self, parser, content, encoding, response_times_allow):
+        """解析一个代理页面，参数和返回值同parse_page，进程池不可用时在调用线程中解析。"""
+        executor = self._get_executor()
+        if executor is not None:
+            try:
+                return executor.submit(parse_page, parser, content, encoding, response_times_allow).result()
+            except BrokenProcessPool:
+                self._logger.warning('parse process pool is broken, parse in thread')
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+        return parse_page(parser, content, encoding, response_times_allow)
+
+    def _get_executor(self):
+        if not self._processes:
+            return None
+        with self._lock:
+            if self._executor is None:
+                # fork会复制父进程的线程锁和redis连接，使用spawn启动干净的解析进程
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self._processes, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """获取进程内所有抓取器共用的解析进程池。"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParsePool()
+        return _pool
@@ -1,11 +1,91 @@
 # coding=utf-8
 
-"""各代理网站解析器。"""
+"""各代理网站解析器。
 
-from datetime import datetime
+表格形式的代理列表页可以继承TableParser，用rows_xpath和columns声明代理行和各字段所在的列，不需要逐个字段编写解析方法。
+"""
 
+from lxml import etree
 
-class ParserKuai:
+
+def seconds_to_ms(value):
+    """把'0.5秒'形式的响应时间转换为毫秒。"""
+    try:
+        return float(value.replace('秒', '')) * 1000
+    except ValueError:
+        # 响应速度只有「秒」，没写数字
+        return 1
+
+
+class Column:
+    """代理行中的一列。
+
+    默认取单元格的全部文本并去掉首尾空白；指定xpath时对单元格执行该xpath，结果为列表时取第一个，没有结果时为''。
+    xpath在定义时编译，解析时不再重复编译。
+    """
+
+    def __init__(self, index, xpath=None, convert=None):
+        """
+        :param index: 列序号，与xpath的td[index]一致，从1开始。
+        :param xpath: 相对于单元格的xpath。
+        :param convert: 对取到的值进行转换的函数。
+        """
+        self.index = index - 1
+        self._xpath = None if xpath is None else etree.XPath(xpath)
+        self._convert = convert
+
+    def extract(self, cells):
+        """从一行的单元格列表中取出本列的值。"""
+        cell = cells[self.index]
+        if self._xpath is None:
+            value = ''.join(cell.itertext()).strip()
+        else:
+            value = self._xpath(cell)
+            if isinstance(value, list):
+                value = value[0] if value else ''
+        return value if self._convert is None else self._convert(value)
+
+
+class TableParser:
+    """表格形式代理列表页的解析器基类。
+
+    子类需要声明rows_xpath和columns：
+    rows_xpath为代理行的xpath，在定义子类时编译；
+    columns为字段名到Column的映射，必须包含ip、port、address、protocol、response_times，可选的https列为真时，
+    代理同时作为https代理返回。
+
+    每行只取一次td单元格列表，各字段直接从对应单元格中提取。
+    """
+    rows_xpath = None
+    columns = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.rows_xpath is not None:
+            cls._rows = etree.XPath(cls.rows_xpath)
+            cls._width = max(column.index for column in cls.columns.values()) + 1
+
+    @classmethod
+    def get_proxies_data(cls, tree):
+        return cls._rows(tree)
+
+    @classmethod
+    def get_proxies(cls, proxy_data):
+        cells = proxy_data.findall('td')
+        if len(cells) < cls._width:
+            return ()
+
+        columns = cls.columns
+        proxy = dict(ip=columns['ip'].extract(cells), port=columns['port'].extract(cells),
+                     address=columns['address'].extract(cells), protocol=columns['protocol'].extract(cells),
+                     src=cls.name, response_times=columns['response_times'].extract(cells))
+
+        if 'https' in columns and columns['https'].extract(cells) and proxy['protocol'].lower() != 'https':
+            return proxy, dict(proxy, protocol='https')
+        return proxy,
+
+
+class ParserKuai(TableParser):
     index_url = 'http://www.kuaidaili.com/free/inha/1/'
     name = 'kuai'
     headers = {
@@ -20,53 +100,17 @@ class ParserKuai:
                       'Chrome / 61.0.3163.100Safari / 537.36'
     }
 
-    @classmethod
-    def get_proxies_data(cls, tree):
-        return tree.xpath('//div[@id="list"]//tbody/tr')
-
-    @classmethod
-    def get_proxies(cls, proxy_data):
-        ip = cls.get_ip(proxy_data)
-        port = cls.get_port(proxy_data)
-        address = cls.get_address(proxy_data)
-        protocol = cls.get_protocol(proxy_data)
-        response_times = cls.get_response_times(proxy_data)
-        src = cls.name
-
-        return (dict(ip=ip, port=port, address=address, protocol=protocol, src=src, response_times=response_times),)
-
-    @classmethod
-    def get_ip(cls, proxy_data):
-        return proxy_data.xpath('./td[1]/text()')[0]
-
-    @classmethod
-    def get_port(cls, proxy_data):
-        return proxy_data.xpath('./td[2]/text()')[0]
-
-    @classmethod
-    def get_address(cls, proxy_data):
-        return proxy_data.xpath('./td[5]/text()')[0]
-
-    @classmethod
-    def get_protocol(cls, proxy_data):
-        return proxy_data.xpath('./td[4]//text()')[0]
-
-    @classmethod
-    def get_response_times(cls, proxy_data):
-        try:
-            response_times = float(proxy_data.xpath('./td[6]/text()')[0].replace('秒', '')) * 1000
-        except ValueError:
-            # 响应速度只有「秒」，没写数字
-            response_times = 1
-
-        return response_times
-
-    @classmethod
-    def get_verify_datetime(cls, proxy_data):
-        return datetime.strptime(proxy_data.xpath('./td[7]/text()')[0], '%Y-%m-%d %H:%M:%S')
+    rows_xpath = '//div[@id="list"]//tbody/tr'
+    columns = {
+        'ip': Column(1),
+        'port': Column(2),
+        'protocol': Column(4),
+        'address': Column(5),
+        'response_times': Column(6, convert=seconds_to_ms),
+    }
 
 
-class ParserXici:
+class ParserXici(TableParser):
     index_url = 'http://www.xicidaili.com/nn/1'
     name = 'xici'
     headers = {
@@ -80,44 +124,14 @@ class ParserXici:
                       'Chrome / 61.0.3163.100Safari / 537.36'
     }
 
-    @classmethod
-    def get_proxies_data(cls, tree):
-        return tree.xpath('//table[@id="ip_list"]/tr[@class]')
-
-    @classmethod
-    def get_proxies(cls, proxy_data):
-        ip = cls.get_ip(proxy_data)
-        port = cls.get_port(proxy_data)
-        address = cls.get_address(proxy_data)
-        protocol = cls.get_protocol(proxy_data)
-        response_times = cls.get_response_times(proxy_data)
-        src = cls.name
-
-        return (dict(ip=ip, port=port, address=address, protocol=protocol, src=src, response_times=response_times),)
-
-    @classmethod
-    def get_ip(cls, proxy_data):
-        return proxy_data.xpath('./td[2]//text()')[0]
-
-    @classmethod
-    def get_port(cls, proxy_data):
-        return proxy_data.xpath('./td[3]//text()')[0]
-
-    @classmethod
-    def get_address(cls, proxy_data):
-        return proxy_data.xpath('./td[4]//text()')[1] if proxy_data.xpath('./td[4][./a]') else ''
-
-    @classmethod
-    def get_protocol(cls, proxy_data):
-        return proxy_data.xpath('./td[6]//text()')[0]
-
-    @classmethod
-    def get_response_times(cls, proxy_data):
-        return float(proxy_data.xpath('./td[7]/div[@title]/@title')[0].replace('秒', '')) * 1000
-
-    @classmethod
-    def get_verify_datetime(cls, proxy_data):
-        return datetime.strptime(proxy_data.xpath('./td[10]//text()')[0], '%y-%m-%d %H:%M')
+    rows_xpath = '//table[@id="ip_list"]/tr[@class]'
+    columns = {
+        'ip': Column(2),
+        'port': Column(3),
+        'address': Column(4, './a/text()'),
+        'protocol': Column(6),
+        'response_times': Column(7, './div/@title', seconds_to_ms),
+    }
 
 
 class ParserGoubanjia:
@@ -181,7 +195,7 @@ class ParserGoubanjia:
         return float(proxy_data.xpath('./td[6]//text()')[0].replace(' 秒', '')) * 1000
 
 
-class ParserCoderbusy:
+class ParserCoderbusy(TableParser):
     index_url = 'https://proxy.coderbusy.com/zh-cn/classical/anonymous-type/highanonymous/p1.aspx'
     name = 'coderbusy'
     headers = {
@@ -196,51 +210,15 @@ class ParserCoderbusy:
                       'Chrome / 61.0.3163.100Safari / 537.36'
     }
 
-    @classmethod
-    def get_proxies_data(cls, tree):
-        return tree.xpath('//tbody/tr')
-
-    @classmethod
-    def get_proxies(cls, proxy_data):
-        ip = cls.get_ip(proxy_data)
-        port = cls.get_port(proxy_data)
-        address = cls.get_address(proxy_data)
-        protocol = cls.get_protocol(proxy_data)
-        response_times = cls.get_response_times(proxy_data)
-        src = cls.name
-
-        if cls.is_suppose_https(proxy_data):
-            return (dict(ip=ip, port=port, address=address, protocol=protocol, src=src, response_times=response_times),
-                    dict(ip=ip, port=port, address=address, protocol='https', src=src, response_times=response_times))
-        else:
-            return (dict(ip=ip, port=port, address=address, protocol=protocol, src=src, response_times=response_times),)
-
-    @classmethod
-    def get_ip(cls, proxy_data):
-        return proxy_data.xpath('./td[1]//text()')[1].strip()
-
-    @classmethod
-    def get_port(cls, proxy_data):
-        return proxy_data.xpath('./td[2]/text()')[0]
-
-    @classmethod
-    def get_address(cls, proxy_data):
-        return proxy_data.xpath('./td[3]//text()')[1]
-
-    @classmethod
-    def get_protocol(cls, proxy_data):
-        return proxy_data.xpath('./td[5]//text()')[0]
-
-    @classmethod
-    def get_response_times(cls, proxy_data):
-        return float(proxy_data.xpath('./td[10]//text()')[0].replace('秒', '')) * 1000
-
-    @classmethod
-    def is_suppose_https(cls, proxy_data):
-        if proxy_data.xpath('./td[8]/span'):
-            return True
-        else:
-            return False
+    rows_xpath = '//tbody/tr'
+    columns = {
+        'ip': Column(1, 'normalize-space((.//text())[2])'),
+        'port': Column(2),
+        'address': Column(3, 'normalize-space((.//text())[2])'),
+        'protocol': Column(5),
+        'https': Column(8, 'boolean(./span)'),
+        'response_times': Column(10, convert=seconds_to_ms),
+    }
 
 
 parsers = [
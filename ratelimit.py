@@ -0,0 +1,55 @@
+# coding=utf-8
+
+"""按域名限速的令牌桶，同一域名的所有抓取线程共用一个令牌桶。"""
+
+import time
+import threading
+
+from .utils import crawl_rate, crawl_burst
+
+
+class TokenBucket:
+    def __init__(self, rate=crawl_rate, burst=crawl_burst):
+        """
+        :param rate: 每秒补充的令牌数。
+        :param burst: 最多积累的令牌数，即允许的突发请求数。
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop=None):
+        """取一个令牌，没有令牌时等待补充。
+
+        :param stop: threading.Event，等待期间被设置时放弃等待。
+        :return: 取到令牌返回True，被stop中断返回False。
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self._rate
+
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return False
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def host_bucket(host):
+    """获取域名对应的令牌桶，不存在时按crawl_rate和crawl_burst创建。"""
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket()
+        return bucket
@@ -0,0 +1,180 @@
+# coding=utf-8
+
+"""代理池HTTP服务。
+
+服务进程通过AsyncProxyPool从本地快照中选取代理，多个使用者进程通过HTTP获取代理，不需要各自启动检查器：
+* GET /get?protocol=http&strategy=random&timeout=0：获取一个代理，返回{"proxy": "ip:port"}；
+* GET /get_many?n=10&protocol=http&replace=0&strategy=random&timeout=0：获取多个代理，返回{"proxies": [...]}；
+* GET /stats：返回可用代理统计，见AsyncProxyPool.stats；
+* POST /report：报告代理使用结果，请求体为{"protocol": "http", "proxy": "ip:port", "ok": true, "latency": 120}
+  或由其组成的列表，报告由UsageReporter批量写入redis。
+
+timeout为没有可用代理时的最长等待时间，单位秒，不超过server_max_wait，超时返回503。n不能超过server_max_n。
+
+运行：python -m proxy_pool.server [--host 127.0.0.1] [--port 8765] [--maintain]
+"""
+
+import json
+import math
+import argparse
+import ipaddress
+
+from aiohttp import web
+
+from .asyncpool import AsyncProxyPool
+from .ProxyPool import STRATEGIES
+from .lease import UsageReporter
+from .snapshot import restore_snapshot
+from .migrate import migrate_legacy
+from .utils import redis_http_https_usable, server_host, server_port, server_max_wait, server_max_n
+
+POOL_KEY = web.AppKey('pool', AsyncProxyPool)
+REPORTER_KEY = web.AppKey('reporter', UsageReporter)
+
+
+def bad_request(message):
+    return web.HTTPBadRequest(text=json.dumps({'error': message}), content_type='application/json')
+
+
+def _query(request):
+    """解析获取代理的公共参数，返回(protocol, strategy, timeout)。"""
+    protocol = request.query.get('protocol', 'http')
+    if protocol not in redis_http_https_usable:
+        raise bad_request('unknown protocol: {}'.format(protocol))
+
+    strategy = request.query.get('strategy')
+    if strategy is not None and strategy not in STRATEGIES:
+        raise bad_request('unknown strategy: {}'.format(strategy))
+
+    try:
+        timeout = float(request.query.get('timeout', 0))
+    except ValueError:
+        raise bad_request('timeout must be a number')
+    return protocol, strategy, min(max(timeout, 0), server_max_wait)
+
+
+def _valid_address(address):
+    """是否为'ip:port'形式的代理地址。"""
+    ip, _, port = address.rpartition(':')
+    try:
+        ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return port.isdigit() and 0 < int(port) < 65536
+
+
+async def handle_get(request):
+    protocol, strategy, timeout = _query(request)
+    try:
+        proxy = await request.app[POOL_KEY].get(protocol, strategy=strategy, timeout=timeout)
+    except TimeoutError as e:
+        return web.json_response({'error': str(e)}, status=503)
+    return web.json_response({'proxy': proxy})
+
+
+async def handle_get_many(request):
+    protocol, strategy, timeout = _query(request)
+    try:
+        n = int(request.query.get('n', 1))
+    except ValueError:
+        raise bad_request('n must be an integer')
+    if n <= 0 or n > server_max_n:
+        raise bad_request('n must be between 1 and {}'.format(server_max_n))
+    replace = request.query.get('replace', '0').lower() in ('1', 'true', 'yes')
+
+    try:
+        proxies = await request.app[POOL_KEY].get_many(n, protocol, replace=replace, strategy=strategy,
+                                                       timeout=timeout)
+    except TimeoutError as e:
+        return web.json_response({'error': str(e)}, status=503)
+    return web.json_response({'proxies': proxies})
+
+
+async def handle_stats(request):
+    return web.json_response(await request.app[POOL_KEY].stats())
+
+
+async def handle_report(request):
+    try:
+        reports = await request.json()
+    except ValueError:
+        raise bad_request('body must be json')
+    if isinstance(reports, dict):
+        reports = [reports]
+    if not isinstance(reports, list):
+        raise bad_request('body must be a report or a list of reports')
+
+    # 先校验全部报告，避免只写入一部分
+    parsed = []
+    for report in reports:
+        if not isinstance(report, dict) or not isinstance(report.get('proxy'), str) \
+                or not isinstance(report.get('ok'), bool):
+            raise bad_request('report requires proxy and a boolean ok')
+        if not _valid_address(report['proxy']):
+            raise bad_request('proxy must be ip:port: {}'.format(report['proxy']))
+        protocol = report.get('protocol', 'http')
+        if protocol not in redis_http_https_usable:
+            raise bad_request('unknown protocol: {}'.format(protocol))
+        latency = report.get('latency')
+        # json.loads接受NaN和Infinity，写入可用队列的分值会使整批报告写入失败
+        if latency is not None and (isinstance(latency, bool) or not isinstance(latency, (int, float))
+                                    or not math.isfinite(latency) or latency < 0):
+            raise bad_request('latency must be a non-negative finite number')
+        parsed.append((protocol, report['proxy'], report['ok'], latency))
+
+    reporter = request.app[REPORTER_KEY]
+    for report in parsed:
+        reporter.add(*report)
+    return web.json_response({'accepted': len(parsed)})
+
+
+def create_app(pool=None):
+    """创建HTTP服务。
+
+    :param pool: AsyncProxyPool对象，为None时创建使用本地快照的AsyncProxyPool。
+    """
+    app = web.Application()
+    app[POOL_KEY] = AsyncProxyPool(snapshot=True) if pool is None else pool
+    app[REPORTER_KEY] = UsageReporter()
+
+    async def on_startup(app):
+        await app[POOL_KEY].start()
+        app[REPORTER_KEY].start()
+
+    async def on_cleanup(app):
+        app[REPORTER_KEY].stop()
+        await app[POOL_KEY].close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get('/get', handle_get)
+    app.router.add_get('/get_many', handle_get_many)
+    app.router.add_get('/stats', handle_stats)
+    app.router.add_post('/report', handle_report)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve proxies from the pool over http')
+    parser.add_argument('--host', default=server_host)
+    parser.add_argument('--port', type=int, default=server_port)
+    parser.add_argument('--maintain', action='store_true', help='also run the checker in this process')
+    args = parser.parse_args(argv)
+
+    checker = None
+    if args.maintain:
+        from .checker import Checker
+        migrate_legacy()
+        restore_snapshot()
+        checker = Checker()
+        checker.start()
+
+    try:
+        web.run_app(create_app(), host=args.host, port=args.port)
+    finally:
+        if checker is not None:
+            checker.quit_scheduler()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# coding=utf-8
+
+"""可用代理的本地快照。
+
+快照在本进程内保存'proxies_http_usable'和'proxies_https_usable'的内容，代理为'ip:port'形式，并按响应时间从快到慢排序。
+快照由PoolWatcher在可用代理更新后触发刷新。
+
+save_snapshot和restore_snapshot把可用代理保存到磁盘上的快照文件，以及在redis中没有可用代理时从中恢复，使代理池重启后不必重新抓取。
+"""
+
+import os
+import json
+import time
+import logging
+
+from .utils import get_redis, redis_http_https_usable, redis_http_https_recheck, redis_pool_version, snapshot_file, \
+    snapshot_max_age, restore_recheck, recheck_age, notify_pool_changed
+
+
+class PoolSnapshot:
+    def __init__(self):
+        self._redis = get_redis()
+        self._logger = logging.getLogger('pool.snapshot')
+        self._proxies = {protocol: [] for protocol in redis_http_https_usable}
+        self._version = None
+        self._loaded = False
+
+    def proxies(self, protocol):
+        """返回某协议的可用代理列表，元素为('ip:port', 响应时间)，按响应时间从快到慢排序。
+
+        :param protocol: 代理协议，'http'或'https'。
+        """
+        return self._proxies[protocol]
+
+    def refresh(self, force=False):
+        """版本号变化时重新加载快照。
+
+        :param force: 为True时不比较版本号，直接重新加载。
+        :return: 是否重新加载了快照。
+        """
+        if self._loaded and not force and self._redis.get(redis_pool_version) == self._version:
+            return False
+
+        pipe = self._redis.pipeline()
+        pipe.get(redis_pool_version)
+        for key in redis_http_https_usable.values():
+            pipe.zrange(key, 0, -1, withscores=True)
+        version, *results = pipe.execute()
+
+        proxies = {protocol: [(address.decode(), latency) for address, latency in result]
+                   for protocol, result in zip(redis_http_https_usable, results)}
+
+        # 整体替换字典，读取方不需要加锁
+        self._proxies = proxies
+        self._version = version
+        self._loaded = True
+        self._logger.info('snapshot refreshed, version: %s, http: %d, https: %d',
+                          version, len(proxies['http']), len(proxies['https']))
+        return True
+
+
+def save_snapshot(path=snapshot_file):
+    """把可用代理保存到快照文件，先写入临时文件再替换，不会留下不完整的文件。
+
+    可用代理为空时不保存，以免覆盖之前保存的快照。
+
+    :param path: 快照文件路径，为None时不保存。
+    :return: 保存的代理数。
+    """
+    if path is None:
+        return 0
+
+    r = get_redis()
+    pipe = r.pipeline()
+    for key in redis_http_https_usable.values():
+        pipe.zrange(key, 0, -1, withscores=True)
+    proxies = {protocol: [(address.decode(), latency) for address, latency in result]
+               for protocol, result in zip(redis_http_https_usable, pipe.execute())}
+
+    count = sum(map(len, proxies.values()))
+    if not count:
+        return 0
+
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump({'saved_at': time.time(), 'proxies': proxies}, f)
+    os.replace(tmp, path)
+    logging.getLogger('pool.snapshot').info('saved %d proxies to %s', count, path)
+    return count
+
+
+def restore_snapshot(path=snapshot_file, max_age=snapshot_max_age, recheck=restore_recheck):
+    """redis中某协议没有可用代理时，从快照文件恢复该协议的可用代理。
+
+    恢复的代理保留保存时的响应时间，不在恢复时验证；recheck为True时安排立即复检，由检查器按recheck_rate滚动复检，
+    失效的代理在复检后被移除。
+
+    :param path: 快照文件路径，为None、文件不存在、无法解析或超过max_age秒时不恢复。
+    :param max_age: 快照文件的最长有效时间，单位秒。
+    :param recheck: 是否安排恢复的代理立即复检，为False时按保存时间加recheck_age复检。
+    :return: 恢复的代理数。
+    """
+    if path is None:
+        return 0
+
+    logger = logging.getLogger('pool.snapshot')
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        saved_at, proxies = data['saved_at'], data['proxies']
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.warning('invalid snapshot file %s', path, exc_info=True)
+        return 0
+
+    if time.time() - saved_at > max_age:
+        logger.info('snapshot file %s is too old, skip restoring', path)
+        return 0
+
+    r = get_redis()
+    recheck_at = time.time() if recheck else saved_at + recheck_age
+    restored = 0
+    for protocol, key in redis_http_https_usable.items():
+        if not proxies.get(protocol) or r.exists(key):
+            continue
+        pipe = r.pipeline(transaction=False)
+        # 多个进程同时恢复时只添加不存在的代理
+        pipe.zadd(key, dict(proxies[protocol]), nx=True)
+        pipe.zadd(redis_http_https_recheck[protocol], dict.fromkeys(dict(proxies[protocol]), recheck_at), nx=True)
+        restored += pipe.execute()[0]
+
+    if restored:
+        notify_pool_changed(r)
+        logger.info('restored %d proxies from %s, saved %.0fs ago', restored, path, time.time() - saved_at)
+    return restored
@@ -1,97 +1,528 @@
 # coding=utf-8
 
-"""代理验证器，通过连接http://httpbin.org/get进行验证。"""
+"""代理验证器，通过代理访问judge（默认为http://httpbin.org/get）进行验证。
 
+进程内所有验证器共用一个验证服务（ValidationService），由验证服务统一调度验证任务，限制总并发数并复用连接。
+提交给验证服务的代理会先经过失败缓存和去重，处于失效期或最近验证过的代理不会被再次验证。
+验证通过的代理直接存入可用队列，并安排下次复检时间；验证失败的代理立即从可用队列中移除。
+每个代理的请求次数和复检间隔由ValidationPolicy根据其连续验证通过次数决定。
+"""
+
+import ssl
 import json
+import time
+import asyncio
 import logging
 import threading
+import collections
 import concurrent.futures
-from queue import Queue
+from urllib.parse import urlsplit
 
+import aiohttp
 import requests
-from .utils import get_redis, redis_http_https
+from requests.adapters import HTTPAdapter
 
+from .blacklist import FailureCache
+from .dedup import Deduplicator
+from .judge import check_origin
+from .utils import get_redis, stats_key, proxy_address, redis_http_https_usable, redis_http_https_recheck, tester_mode, \
+    tester_concurrency, tester_max_workers, tester_timeout, recheck_age, ChangeNotifier, probe_timeout, \
+    reliable_streak, recheck_max_factor, judge_url, judge_verify, stats_ttl
 
-class Tester:
-    def __init__(self, test_times, queue=None):
-        """初始化验证器。
+# 代理验证通过时记录到验证统计中的代理信息
+PROXY_INFO_FIELDS = ('src', 'address', 'response_times')
 
-        :param test_times: 验证次数，指使用某个代理进行测试连接的次数。
+# 验证任务优先级，数值越小越优先
+PRIORITY_RECHECK = 0  # 复检可用代理
+PRIORITY_CRAWL = 1  # 验证新抓取的代理
+
+# 提交验证任务的结果
+SUBMITTED = 'submitted'  # 已提交验证
+SKIP_NO_JUDGE = 'no_judge'  # 没有该协议的judge，无法验证
+SKIP_DEAD = 'dead'  # 处于失效期
+SKIP_RECENT = 'recent'  # 最近验证过，被去重丢弃
+
+
+async def _count_connection(session, context, params):
+    """aiohttp的trace回调，记录一次请求新建的连接数。"""
+    context.trace_request_ctx['created'] += 1
+
+
+def _connection_trace():
+    """aiohttp对断开的连接会自动重试一次GET请求，代理断开连接后第二次请求成功时不会抛出异常，
+    因此记录每次请求新建的连接数。复用的空闲连接已被代理关闭时重试是正常的，新建了多个连接才说明代理断开了新连接，按失败处理。
+    """
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_start.append(_count_connection)
+    return trace
+
+
+class _FairScheduler:
+    """验证任务调度队列。
+
+    优先取优先级高的任务；同一优先级内，在各个提交任务的验证器之间轮流取任务，避免某个爬虫提交的大量代理阻塞其他爬虫。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._levels = {}  # 优先级 -> OrderedDict(验证器 -> 待验证代理队列)
+
+    def put(self, priority, owner, item):
+        with self._cond:
+            level = self._levels.setdefault(priority, collections.OrderedDict())
+            level.setdefault(owner, collections.deque()).append(item)
+            self._cond.notify()
+
+    def get(self):
+        """阻塞直到取得一个任务，返回(验证器, 待验证代理)。"""
+        with self._cond:
+            while True:
+                for priority in sorted(self._levels):
+                    level = self._levels[priority]
+                    if not level:
+                        continue
+
+                    owner, items = next(iter(level.items()))
+                    item = items.popleft()
+                    if items:
+                        level.move_to_end(owner)
+                    else:
+                        del level[owner]
+                    return owner, item
+
+                self._cond.wait()
+
+
+class ValidationPolicy:
+    """自适应验证策略，根据代理的连续验证通过次数决定请求次数和复检间隔。
+
+    * 新代理（连续通过次数为0）：第一次请求的超时时间缩短为probe_timeout，失效代理很快被淘汰，第一次请求通过后才进行其余请求；
+    * 一般代理：进行验证器指定的test_times次请求；
+    * 稳定代理（连续通过次数不少于reliable_streak）：只请求一次，复检间隔随连续通过次数增长，最长为recheck_age的recheck_max_factor倍。
+    """
+
+    def __init__(self, first_timeout=probe_timeout, timeout=tester_timeout, streak=reliable_streak,
+                 max_factor=recheck_max_factor):
+        self._first_timeout = first_timeout
+        self._timeout = timeout
+        self._streak = streak
+        self._max_factor = max_factor
+
+    def timeouts(self, test_times, streak):
+        """返回各次请求的超时时间列表，列表长度即请求次数。
+
+        :param test_times: 验证器指定的请求次数。
+        :param streak: 代理的连续验证通过次数。
         """
-        self._proxies_queue_to_test = Queue() if queue is None else queue
-        self._test_times = test_times
-        self._valid_proxies = get_redis()
+        if streak >= self._streak:
+            return [self._timeout]
+        if streak == 0:
+            return [self._first_timeout] + [self._timeout] * (test_times - 1)
+        return [self._timeout] * test_times
+
+    def recheck_interval(self, streak):
+        """返回验证通过后到下次复检的间隔，单位秒。
+
+        :param streak: 代理本次验证通过后的连续验证通过次数。
+        """
+        return recheck_age * min(1 + streak // self._streak, self._max_factor)
+
+
+class ValidationService:
+    def __init__(self, mode=tester_mode, concurrency=None, policy=None, judge=judge_url, validator=check_origin,
+                 verify_judge=judge_verify):
+        """初始化验证服务。
+
+        :param mode: 验证模式，'thread'为线程池验证，'async'为asyncio验证。
+        :param concurrency: 同时进行验证的代理数上限，默认按验证模式取tester_max_workers或tester_concurrency。
+        :param policy: 验证策略，默认使用ValidationPolicy()。
+        :param judge: 验证请求地址，其中的'{protocol}'会被替换为代理支持的协议；也可以是协议到地址的字典，
+                      如JudgeServer.urls()。地址的协议与代理协议不一致时不验证该协议的代理。
+        :param validator: 响应校验函数，参数为(代理字典, 状态码, 响应内容bytes)，校验通过返回True。
+        :param verify_judge: 是否校验judge的https证书，judge使用自签名证书时设为False。
+        """
+        if concurrency is None:
+            concurrency = tester_concurrency if mode == 'async' else tester_max_workers
+
+        self._mode = mode
+        self._concurrency = concurrency
+        self._policy = ValidationPolicy() if policy is None else policy
         self._logger = logging.getLogger('pool.tester')
+        self._judges = self._resolve_judges(judge)
+        self._verify_judge = verify_judge
+        self._validator = validator
+        self._scheduler = _FairScheduler()
+        self._valid_proxies = get_redis()
+        self._dedup = Deduplicator()
+        self._failures = FailureCache()
+        self._notifier = ChangeNotifier()
+        self._sentinel = object()  # 服务停止信号
+        self._lock = threading.Lock()
         self._worker = None
 
+    def _resolve_judges(self, judge):
+        """得到各协议的judge地址。
+
+        只有通过https访问judge，https代理的CONNECT隧道和TLS才会被验证，通过http访问judge时不支持https的代理也能通过验证，
+        因此地址的协议与代理协议不一致时不使用该地址，该协议的代理不会被验证。
+        """
+        if isinstance(judge, str):
+            judge = {protocol: judge.format(protocol=protocol) for protocol in redis_http_https_usable}
+
+        judges = {}
+        for protocol, url in judge.items():
+            if urlsplit(url).scheme != protocol:
+                self._logger.warning('judge %s can not validate %s proxies, they will not be tested', url, protocol)
+                continue
+            judges[protocol] = url
+        return judges
+
     def start(self):
-        """通过此接口启动验证器，结束一轮验证后，再次使用要重新启动。"""
-        self._worker = threading.Thread(target=self._work)
-        self._worker.setDaemon(True)
-        self._worker.start()
+        """启动验证服务，服务已在运行时不做任何操作。"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work)
+                self._worker.setDaemon(True)
+                self._worker.start()
 
-    def test(self, proxy):
-        """代理验证接口。
+    def stop(self):
+        """停止验证服务，已提交的任务验证完毕后工作线程退出。"""
+        # 停止信号的优先级最低，调度队列中的任务都被取出后才会取到它
+        self._scheduler.put(float('inf'), None, self._sentinel)
+        if self._worker:
+            self._worker.join()
 
-        待验证代理会被放入'_proxies_queue_to_test'队列中，交由工作线程进行验证。
+    def can_validate(self, protocol):
+        """是否有该协议的judge，没有judge的协议的代理不会被验证。"""
+        return protocol in self._judges
 
-        :param proxy: 代理字典的json字符串表示，传入'end'结束本轮验证。
+    def submit(self, tester, proxy):
+        """提交验证任务。
+
+        :param tester: 提交任务的验证器，决定任务优先级和验证次数，验证结束后会通知该验证器。
+        :param proxy: 待验证代理字典。
+        :return: 提交结果，SUBMITTED表示已提交验证；没有对应协议judge的代理（SKIP_NO_JUDGE）和处于失效期的代理（SKIP_DEAD）
+                 直接丢弃；验证器要求去重时，最近验证过的代理（SKIP_RECENT）也直接丢弃。
         """
-        self._proxies_queue_to_test.put(proxy)
+        if not self.can_validate(proxy['protocol'].lower()):
+            self._logger.debug('no judge for %s proxy: %s', proxy['protocol'], proxy['ip'])
+            return SKIP_NO_JUDGE
 
-    def is_done(self):
-        """验证器是否完成了所有代理的验证。"""
-        if self._worker:
-            return not self._worker.is_alive()
+        if self._failures.is_dead(proxy['protocol'].lower(), proxy_address(proxy)):
+            self._logger.debug('skip dead proxy: %s', proxy['ip'])
+            return SKIP_DEAD
+
+        if tester.dedup and self._dedup.claim(proxy) is not None:
+            self._logger.debug('skip recently tested proxy: %s', proxy['ip'])
+            return SKIP_RECENT
+
+        streak = int(self._valid_proxies.hget(stats_key(proxy), 'streak') or 0)
+        self.start()
+        self._scheduler.put(tester.priority, tester, (proxy, streak))
+        return SUBMITTED
+
+    def _finish(self, tester, proxy, streak, latency):
+        """记录验证结果并通知验证器。
+
+        :param streak: 本次验证前代理的连续验证通过次数。
+        :param latency: 验证通过时为各次请求的平均响应时间，单位毫秒；验证失败时为None。
+        """
+        ok = latency is not None
+        self._dedup.record(proxy, ok)
+        protocol = proxy['protocol'].lower()
+        address = proxy_address(proxy)
+        info = {field: proxy[field] for field in PROXY_INFO_FIELDS if field in proxy}
+
+        pipe = self._valid_proxies.pipeline()
+        # 从未通过验证的代理验证失败时不记录验证统计，否则统计会随抓取到的候选代理无限增长
+        if ok or streak:
+            key = stats_key(proxy)
+            pipe.hincrby(key, 'checks', 1)
+            pipe.hset(key, 'checked_at', int(time.time()))
+            if ok:
+                pipe.hincrby(key, 'successes', 1)
+                pipe.hincrby(key, 'streak', 1)
+                pipe.hset(key, 'latency', latency)
+                pipe.hincrbyfloat(key, 'latency_total', latency)
+                if info:
+                    pipe.hset(key, mapping=info)
+            else:
+                pipe.hset(key, 'streak', 0)
+            pipe.expire(key, stats_ttl)
+        if ok:
+            recheck_at = time.time() + self._policy.recheck_interval(streak + 1)
+            pipe.zadd(redis_http_https_recheck[protocol], {address: recheck_at})
+            pipe.zadd(redis_http_https_usable[protocol], {address: latency})
+        else:
+            pipe.zrem(redis_http_https_recheck[protocol], address)
+            pipe.zrem(redis_http_https_usable[protocol], address)
+        # 最后一条命令的结果为新增或移除的可用代理数，可用代理有增减时才发布通知
+        if pipe.execute()[-1]:
+            self._notifier.changed()
+
+        if ok:
+            self._logger.info("test %s://%s ok, %.0fms", protocol, address, latency)
+            self._failures.record_success(protocol, address)
+        else:
+            self._failures.record_failure(protocol, address)
+
+        self._logger.debug('test %s done', proxy['ip'])
+        if tester.callback is not None:
+            tester.callback(proxy, latency)
+        tester.task_done()
 
-    def _test_single_proxy(self, requests_session, proxy):
+    def _test_single_proxy(self, requests_session, tester, proxy, streak):
         """验证代理的工作接口。
 
-        验证器会根据代理支持的协议，对'http://httpbin.org/get'或'https://httpbin.org/get'进行'test_times'此请求，每次请求超时
-        时间为5s，若5次请求均成功则将代理存入'proxies_http'或'proxies_https'缓存中。请求成功的定义是状态码200，无重定向，并且返回的json
-        内容中'origin'字段值和代理地址一致。
+        验证器会根据代理支持的协议，通过代理对judge（默认为'http://httpbin.org/get'或'https://httpbin.org/get'）依次发送请求，
+        请求次数和每次请求的超时时间由验证策略决定，若请求均成功则将代理存入'proxies_http_usable'或'proxies_https_usable'中，
+        分值为平均响应时间。请求不跟随重定向，是否成功由响应校验函数判断，默认规则见judge.check_origin。
 
         :param requests_session: requests session对象。
-        :param proxy: 待验证代理字典的json字符串表示。
+        :param tester: 提交任务的验证器。
+        :param proxy: 待验证代理字典。
+        :param streak: 代理的连续验证通过次数。
         """
-        proxy_protocol = proxy['protocol'].lower()
-        proxy_str = '{}://{}:{}'.format(proxy_protocol, proxy['ip'], proxy['port'])
+        url = self._judges[proxy['protocol'].lower()]
+        # 与aiohttp一致，https请求通过CONNECT隧道转发
+        proxy_str = 'http://{}:{}'.format(proxy['ip'], proxy['port'])
+        timeouts = self._policy.timeouts(tester.test_times, streak)
 
+        latency = None
+        start = time.perf_counter()
         try:
-            for i in range(self._test_times):
-                with requests_session.get('{}://httpbin.org/get'.format(proxy_protocol),
-                                          proxies={proxy_protocol: proxy_str}, timeout=5) as resp:
-                    if resp.status_code != 200 or resp.history:
-                        break
-                    if resp.json()['origin'] != proxy['ip']:
+            for timeout in timeouts:
+                # 环境变量中的证书设置会覆盖session.verify，因此在每次请求中指定
+                with requests_session.get(url, proxies={'http': proxy_str, 'https': proxy_str}, timeout=timeout,
+                                          allow_redirects=False, verify=self._verify_judge) as resp:
+                    if not self._validator(proxy, resp.status_code, resp.content):
                         break
             else:
-                self._logger.info("test %s ok", proxy_str)
-                self._valid_proxies.sadd(redis_http_https[proxy_protocol], json.dumps(proxy))
+                latency = (time.perf_counter() - start) * 1000 / len(timeouts)
         except requests.exceptions.RequestException:
             pass
+        finally:
+            self._finish(tester, proxy, streak, latency)
 
-        self._logger.debug('test %s done', proxy['ip'])
+    async def _test_single_proxy_async(self, context, trace, semaphore, tester, proxy, streak):
+        """验证代理的工作接口，验证规则同_test_single_proxy。
 
-    def _work(self):
-        """验证器工作线程，创建一个包含100个线程的线程池，从'_proxies_queue_to_test'中获取代理进行验证。
-        当从队列中取到无效json字符串的时候会清空'_proxies_queue_to_test'队列并等待当前待验证代理全部验证结束后退出。
+        对同一代理的多次请求依次进行，共用一个连接池，代理支持长连接时复用连接，验证结束后关闭。
+        任意一次失败即放弃该代理，不再进行后续请求，在新连接上被aiohttp自动重试过的请求也算作失败。
+
+        :param context: 访问https judge使用的ssl context。
+        :param trace: 记录新建连接数的aiohttp TraceConfig。
+        :param semaphore: 限制并发数的信号量，验证结束后释放。
+        :param tester: 提交任务的验证器。
+        :param proxy: 待验证代理字典。
+        :param streak: 代理的连续验证通过次数。
         """
-        tasks = []
+        url = self._judges[proxy['protocol'].lower()]
+        timeouts = self._policy.timeouts(tester.test_times, streak)
+
+        latency = None
+        start = time.perf_counter()
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=1, ssl=context), trace_configs=[trace])
+        try:
+            for timeout in timeouts:
+                attempt = {'created': 0}
+                # aiohttp只支持http代理，https请求会通过CONNECT隧道转发
+                async with session.get(url, proxy='http://{}:{}'.format(proxy['ip'], proxy['port']),
+                                       timeout=aiohttp.ClientTimeout(total=timeout), allow_redirects=False,
+                                       trace_request_ctx=attempt) as resp:
+                    if attempt['created'] > 1 or not self._validator(proxy, resp.status, await resp.read()):
+                        break
+            else:
+                latency = (time.perf_counter() - start) * 1000 / len(timeouts)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        finally:
+            await session.close()
+            semaphore.release()
+            # 记录结果需要多次访问redis，放到线程池中执行，避免阻塞事件循环
+            await asyncio.get_running_loop().run_in_executor(None, self._finish, tester, proxy, streak, latency)
+
+    def _work(self):
+        if self._mode == 'async':
+            asyncio.run(self._async_work())
+        else:
+            self._thread_work()
+
+    def _thread_work(self):
+        """线程池验证模式的工作线程，线程池大小为'concurrency'，所有验证共用一个连接池。"""
+        slots = threading.BoundedSemaphore(self._concurrency)
 
         with requests.Session() as requests_session:
-            with concurrent.futures.ThreadPoolExecutor(max_workers=60) as executor:
+            adapter = HTTPAdapter(pool_connections=self._concurrency, pool_maxsize=self._concurrency)
+            requests_session.mount('http://', adapter)
+            requests_session.mount('https://', adapter)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self._concurrency) as executor:
                 while True:
-                    try:
-                        if self._proxies_queue_to_test.empty():
-                            continue
-                        proxy_to_test = json.loads(self._proxies_queue_to_test.get())
-                    except json.decoder.JSONDecodeError:
-                        concurrent.futures.wait(tasks)
-                        with self._proxies_queue_to_test.mutex:
-                            self._proxies_queue_to_test.queue.clear()
-                        self._logger.info('test quit')
+                    # 线程池满时在此等待，待验证代理留在调度队列中，保证优先级生效
+                    slots.acquire()
+                    tester, job = self._scheduler.get()
+                    if job is self._sentinel:
                         break
-                    else:
-                        self._logger.debug('get proxy to test: %s', proxy_to_test['ip'])
-                        tasks.append(executor.submit(self._test_single_proxy, requests_session, proxy_to_test))
+
+                    proxy, streak = job
+                    self._logger.debug('get proxy to test: %s', proxy['ip'])
+                    future = executor.submit(self._test_single_proxy, requests_session, tester, proxy, streak)
+                    future.add_done_callback(lambda f: slots.release())
+
+        self._logger.info('validation service quit')
+
+    def _feed(self, loop, jobs, slots):
+        """把调度队列中的任务转交给事件循环，有空闲并发额度时才取任务，保证优先级生效。
+
+        阻塞地读取调度队列需要在单独的守护线程中进行，不能占用事件循环的默认线程池，否则进程无法正常退出。
+        """
+        while True:
+            slots.acquire()
+            job = self._scheduler.get()
+            loop.call_soon_threadsafe(jobs.put_nowait, job)
+            if job[1] is self._sentinel:
+                break
+
+    async def _async_work(self):
+        """asyncio验证模式的工作协程，最多同时验证'concurrency'个代理，每个代理的各次请求共用一个连接池。"""
+        loop = asyncio.get_running_loop()
+        jobs = asyncio.Queue()
+        slots = threading.BoundedSemaphore(self._concurrency)
+        tasks = set()
+
+        feeder = threading.Thread(target=self._feed, args=(loop, jobs, slots))
+        feeder.setDaemon(True)
+        feeder.start()
+
+        # 连接只在同一代理的各次请求之间复用，验证结束后关闭，不会在连接池中积累大量失效代理的空闲连接
+        context = ssl.create_default_context()
+        if not self._verify_judge:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        trace = _connection_trace()
+        while True:
+            tester, job = await jobs.get()
+            if job is self._sentinel:
+                if tasks:
+                    await asyncio.wait(tasks)
+                break
+
+            proxy, streak = job
+            self._logger.debug('get proxy to test: %s', proxy['ip'])
+            task = loop.create_task(self._test_single_proxy_async(context, trace, slots, tester, proxy, streak))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        self._logger.info('validation service quit')
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_validation_service():
+    """获取进程内共享的验证服务。"""
+    global _service
+
+    with _service_lock:
+        if _service is None:
+            _service = ValidationService()
+        return _service
+
+
+def set_validation_service(service):
+    """替换进程内共享的验证服务，之后创建的验证器都会使用新的验证服务，如指向自行部署的judge。
+
+    :param service: 新的验证服务。
+    :return: 原来的验证服务，未创建过时为None。
+    """
+    global _service
+
+    with _service_lock:
+        old, _service = _service, service
+        return old
+
+
+class Tester:
+    def __init__(self, test_times, priority=PRIORITY_CRAWL, service=None, dedup=True, callback=None):
+        """初始化验证器。
+
+        验证器本身不进行验证，而是把待验证代理提交给共享的验证服务，并统计本轮验证的完成情况。
+
+        :param test_times: 验证次数，指使用某个代理进行测试连接的次数。
+        :param priority: 验证任务优先级，复检可用代理使用PRIORITY_RECHECK，验证新抓取代理使用PRIORITY_CRAWL。
+        :param service: 验证服务，默认使用进程内共享的验证服务。
+        :param dedup: 是否丢弃最近验证过的代理，复检到期的代理必须重新验证，复检时应为False。
+        :param callback: 每个代理验证结束后在验证服务的线程中调用，参数为(代理字典, 响应时间)，验证失败时响应时间为None。
+        """
+        self.test_times = test_times
+        self.priority = priority
+        self.dedup = dedup
+        self.callback = callback
+        self._service = get_validation_service() if service is None else service
+        self._logger = logging.getLogger('pool.tester')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._ended = False
+        self._done = threading.Event()
+
+    def start(self):
+        """通过此接口开始一轮验证，结束一轮验证后，再次使用要重新启动。"""
+        with self._lock:
+            self._pending = 0
+            self._ended = False
+            self._done.clear()
+        self._service.start()
+
+    def test(self, proxy):
+        """代理验证接口。
+
+        待验证代理会被提交给验证服务，由验证服务去重后调度验证。
+
+        :param proxy: 代理字典的json字符串表示。
+        :return: 是否提交给了验证服务，没有judge、处于失效期或最近验证过的代理会被丢弃。
+        """
+        return self.submit(proxy) == SUBMITTED
+
+    def submit(self, proxy):
+        """同test，返回提交结果，见ValidationService.submit。"""
+        with self._lock:
+            self._pending += 1
+        result = self._service.submit(self, json.loads(proxy))
+        if result != SUBMITTED:
+            self.task_done()
+        return result
+
+    def can_test(self, protocol):
+        """验证服务是否能验证该协议的代理。"""
+        return self._service.can_validate(protocol)
+
+    def end(self):
+        """结束本轮验证，已提交的代理全部验证完毕后本轮验证结束。"""
+        with self._lock:
+            self._ended = True
+            self._check_done()
+
+    def task_done(self):
+        """由验证服务在某个代理验证结束后调用。"""
+        with self._lock:
+            self._pending -= 1
+            self._check_done()
+
+    def is_done(self):
+        """验证器是否完成了所有代理的验证。"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """阻塞直到本轮验证结束。
+
+        :param timeout: 最长等待时间，单位秒，为None时一直等待。
+        :return: 本轮验证是否已结束。
+        """
+        return self._done.wait(timeout)
+
+    def _check_done(self):
+        if self._ended and self._pending == 0 and not self._done.is_set():
+            self._logger.info('test quit')
+            self._done.set()
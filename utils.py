@@ -1,57 +1,260 @@
 
+import os
+import time
 import logging  # 引入logging模块
+import threading
+
 import redis
 
 
 log_format = '%(asctime)s - %(name)s[line:%(lineno)d] - %(levelname)s: %(message)s'
 logging.basicConfig(level=logging.INFO, format=log_format)
 
-# redis可用队列
+# redis可用队列，有序集合，成员为'ip:port'，分值为实测响应时间，单位毫秒，代理的其他信息存放在验证统计中
 redis_http_usable = 'proxies_http_usable'
 redis_https_usable = 'proxies_https_usable'
-# redis测试队列
-redis_http = 'proxies_http'
-redis_https = 'proxies_https'
-redis_http_https = {'http': redis_http, 'https': redis_https}
+redis_http_https_usable = {'http': redis_http_usable, 'https': redis_https_usable}
+# redis复检队列，有序集合，成员与可用队列一致，分值为下次复检的时间戳
+redis_http_recheck = 'proxies_http_recheck'
+redis_https_recheck = 'proxies_https_recheck'
+redis_http_https_recheck = {'http': redis_http_recheck, 'https': redis_https_recheck}
+
+# 可用代理版本号，可用代理更新后加一，并在redis_pool_channel频道上发布新版本号
+redis_pool_version = 'proxies_usable_version'
+redis_pool_channel = 'proxies_usable_changed'
+
+# 代理验证统计的键前缀，完整键为'proxy_stats:{protocol}:{ip}:{port}'，类型为hash，字段包括：
+# checks验证次数，successes验证通过次数，streak连续验证通过次数，latency最近一次实测响应时间，latency_total验证通过时响应时间之和，checked_at最近验证时间，
+# 以及代理验证通过时记录的src来源网站、address代理所在地、response_times代理网站标注的响应时间，
+# 和使用者报告的uses使用次数、use_failures使用失败次数、use_fail_streak连续使用失败次数、used_at最近报告时间。
+# 从未通过验证的代理验证失败时不记录统计
+redis_stats_prefix = 'proxy_stats'
+# 验证统计的过期时间，单位秒，每次写入时重置，需要长于可用代理的最长复检间隔（recheck_age * recheck_max_factor）
+stats_ttl = 86400
 
 # 缓存http个
 cache_http_number = 20
 # 缓存https个
 cache_https_number = 1
+# 检查可用代理数量的间隔，单位秒，数量过少时启动爬虫补充
+check_interval = 60
+
+# 每个代理网站同时抓取的页面数
+crawl_concurrency = 3
+# 每个域名的抓取速率，令牌桶每秒补充crawl_rate个令牌，最多积累crawl_burst个
+crawl_rate = 2
+crawl_burst = 3
+# 抓取请求超时时间，单位秒
+crawl_timeout = 5
+# 代理网站抓取统计的键前缀，完整键为'source_stats:{name}'和'source_stats:{name}:pages'，类型为hash
+redis_source_prefix = 'source_stats'
+# 最近yield_window个验证完毕的页面中验证通过的代理占比低于yield_min时，停止抓取该网站后面的页面，
+# 占比不计最近验证过而被去重的代理，代理都已去重或页面未修改的页面不计入
+yield_window = 5
+yield_min = 0.02
+# 解析不出代理行的页面，或连续crawl_skip_run个重试后仍抓取失败的页面，视为已超出代理列表的末页，停止抓取该网站后面的页面
+crawl_skip_run = 3
+# 一次补充代理最长的抓取时间，单位秒，超时后停止抓取，由下一次检查继续补充
+refill_timeout = 600
+# 补充代理时按历史产出速度依次启动抓取器，前面的抓取器启动refill_escalate秒后代理仍不足，或者都已停止抓取时，启动下一个
+refill_escalate = 30
+# 解析页面的进程数，为0时在各抓取器的解析线程中解析；大于0时所有抓取器共用一个进程池解析，此时主程序需要有
+# if __name__ == '__main__'保护
+parse_processes = 0
+
+# 代理最近一次验证超过recheck_age秒后会被复检
+recheck_age = 600
+# 复检速率，每秒最多提交recheck_rate个代理进行复检
+recheck_rate = 50
+# 连续验证通过reliable_streak次以上的代理视为稳定代理，复检时只请求一次，复检间隔随连续通过次数增长，最长为recheck_age的
+# recheck_max_factor倍
+reliable_streak = 3
+recheck_max_factor = 4
+
+# 验证模式，'thread'为线程池验证，'async'为asyncio验证
+tester_mode = 'async'
+# 进程内所有验证共用的并发上限，asyncio模式下为同时验证的代理数，线程池模式下为线程数
+tester_concurrency = 1000
+tester_max_workers = 60
+# 验证请求地址（judge），'{protocol}'会被替换为代理支持的协议，也可以是协议到地址的字典，可指向自行部署的judge.JudgeServer
+# 以降低验证延迟。地址的协议必须与代理协议一致，否则该协议的代理不会被验证，https代理必须通过https访问judge
+judge_url = '{protocol}://httpbin.org/get'
+# 是否校验judge的https证书，judge使用自签名证书时设为False
+judge_verify = True
+# 'python -m proxy_pool.judge'默认监听的端口，提供了证书时在judge_tls_port上提供https服务
+judge_port = 8899
+judge_tls_port = 8898
+# 验证请求超时时间，单位秒
+tester_timeout = 5
+# 新代理第一次请求的超时时间，单位秒，第一次请求通过后才进行其余请求
+probe_timeout = 2
+# 可用代理增加后发布更新通知的最小间隔，单位秒，期间的多次增加合并为一次通知
+pool_notify_interval = 1
+
+# 待验证代理去重记录的键前缀，完整键为'proxy_seen:{protocol}:{ip}:{port}'
+redis_seen_prefix = 'proxy_seen'
+# 去重记录保留时间，单位秒，期间同一代理不会被重复验证
+dedup_ttl = 600
+
+# 失败代理缓存的键前缀，完整键为'proxy_failed[:{scope}]:dead:{protocol}:{ip}:{port}'和
+# 'proxy_failed[:{scope}]:count:{protocol}:{ip}:{port}'
+redis_failed_prefix = 'proxy_failed'
+# 失败代理的失效时间，单位秒，随连续失败次数翻倍，直到最大值
+failure_ttl_base = 300
+failure_ttl_max = 86400
+
+# 代理网站页面缓存的键前缀，完整键为'page_cache:{url}'，类型为hash，字段包括etag、last_modified和页面内容的sha1
+redis_page_prefix = 'page_cache'
+# 页面缓存保留时间，单位秒，过期后重新抓取的页面一定会被解析
+page_cache_ttl = 86400
+
+# ProxyPool默认的代理选取策略，'random'随机选取，'fastest'从最快的pool_fastest_n个代理中随机选取，
+# 'weighted'从最快的pool_weighted_n个代理中按响应时间倒数加权随机选取，候选代理有上限，每次获取不需要读取整个可用队列
+pool_strategy = 'random'
+pool_fastest_n = 10
+pool_weighted_n = 100
+# ProxyPool在没有收到可用代理更新通知时，检查可用代理版本号的间隔，单位秒
+pool_check_interval = 60
+# 等待可用代理时，没有收到更新通知也会每隔pool_wait_poll秒重新检查一次，单位秒
+pool_wait_poll = 5
+# 同一代理同时租出的租约数上限，所有进程的ProxyPool共用'proxy_lease:{protocol}:{ip}:{port}'中登记的租约，
+# 类型为有序集合，成员为租约标识，分值为到期时间
+lease_cap = 4
+redis_lease_prefix = 'proxy_lease'
+# 租约的有效时间，单位秒，使用者进程退出前未释放的租约最多lease_ttl秒后不再计入
+lease_ttl = 300
+# 租用代理时抽取的候选代理数，候选代理的租约都已满时重新抽取，每次抽取的候选代理数翻倍，最多抽取lease_resample次仍没有可租用代理时等待租约释放
+lease_candidates = 10
+lease_resample = 3
+# 使用报告的批量写入间隔，单位秒，缓存满report_batch条时立即写入
+report_flush_interval = 1
+report_batch = 100
+# 每次使用失败时可用队列中代理分值增加的毫秒数，连续使用失败evict_failures次时移出可用队列
+demote_penalty = 1000
+evict_failures = 3
 
-redis_pool = redis.ConnectionPool()
+# 可用代理在磁盘上的快照文件，领导者检查器每隔snapshot_save_interval秒保存一次，ProxyPool启动时若redis中没有可用代理则从中恢复，
+# 为None时不保存也不恢复；超过snapshot_max_age秒的快照文件不再恢复
+snapshot_file = os.path.join(os.path.expanduser('~'), '.proxy_pool_snapshot.json')
+snapshot_save_interval = 300
+snapshot_max_age = 86400
+# 从快照文件恢复的代理是否立即复检，为False时按保存时间加recheck_age复检
+restore_recheck = True
+
+# 领导者选举的键前缀，完整键为'proxy_leader:{name}'，值为领导者进程的标识
+redis_leader_prefix = 'proxy_leader'
+# 领导权的有效时间，单位秒，领导者每隔leader_ttl/3秒续约，失联后最多leader_ttl秒由其他进程接替
+leader_ttl = 15
+
+# 'python -m proxy_pool.server'默认监听的地址和端口
+server_host = '127.0.0.1'
+server_port = 8765
+# /get和/get_many请求没有可用代理时最长可以等待的时间，单位秒
+server_max_wait = 30
+# /get_many一次最多获取的代理数，超过时返回400
+server_max_n = 1000
+
+# redis地址
+redis_url = 'redis://localhost:6379/0'
+redis_pool = redis.ConnectionPool.from_url(redis_url)
 
 
 def get_redis():
     return redis.Redis(connection_pool=redis_pool)
 
 
+def get_async_redis():
+    """返回连接redis_url的redis.asyncio客户端，客户端只能在创建它的事件循环中使用。"""
+    import redis.asyncio
+    return redis.asyncio.Redis.from_url(redis_url)
+
+
+def proxy_address(proxy):
+    """代理字典对应的'ip:port'，即可用队列中的成员。"""
+    return '{}:{}'.format(proxy['ip'], proxy['port'])
+
+
+def address_stats_key(protocol, address):
+    """代理验证统计的键。
+
+    :param protocol: 代理协议，'http'或'https'。
+    :param address: 'ip:port'形式的代理地址。
+    """
+    return '{}:{}:{}'.format(redis_stats_prefix, protocol, address)
+
+
+def lease_key(protocol, address):
+    """代理租约计数的键。
+
+    :param protocol: 代理协议，'http'或'https'。
+    :param address: 'ip:port'形式的代理地址。
+    """
+    return '{}:{}:{}'.format(redis_lease_prefix, protocol, address)
+
+
+def stats_key(proxy):
+    """代理验证统计的键。
+
+    :param proxy: 代理字典。
+    """
+    return address_stats_key(proxy['protocol'].lower(), proxy_address(proxy))
+
+
+def notify_pool_changed(r):
+    """可用代理更新后调用，增加可用代理版本号并发布通知。
+
+    :param r: redis连接。
+    :return: 新版本号。
+    """
+    version = r.incr(redis_pool_version)
+    r.publish(redis_pool_channel, version)
+    return version
+
+
+class ChangeNotifier:
+    """合并短时间内的多次可用代理更新，最多每interval秒调用一次notify_pool_changed。
+
+    距上次通知已超过interval秒时立即通知，否则在间隔结束时通知一次。
+    """
+
+    def __init__(self, interval=pool_notify_interval):
+        self._redis = get_redis()
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._timer = None
+        self._last_notify = float('-inf')
+
+    def changed(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+
+            delay = self._last_notify + self._interval - time.monotonic()
+            self._timer = threading.Timer(max(delay, 0), self._notify)
+            self._timer.setDaemon(True)
+            self._timer.start()
+
+    def _notify(self):
+        with self._lock:
+            self._timer = None
+            self._last_notify = time.monotonic()
+        notify_pool_changed(self._redis)
+
+
 def proxy_info():
     r = get_redis()
-    http_usable = r.scard(redis_http_usable)
-    https_usable = r.scard(redis_https_usable)
-    http = r.scard(redis_http)
-    https = r.scard(redis_https)
-    print(http_usable, https_usable, http, https)
+    http_usable = r.zcard(redis_http_usable)
+    https_usable = r.zcard(redis_https_usable)
+    http_due = r.zcount(redis_http_recheck, '-inf', time.time())
+    https_due = r.zcount(redis_https_recheck, '-inf', time.time())
+    print(http_usable, https_usable, http_due, https_due)
 
 
 class RedisAction:
     def __init__(self):
         self._redis = get_redis()
 
-    def redis_move(self):
-        pipe = self._redis.pipeline()
-        for i in range(self._redis.scard(redis_http_usable)):
-            pipe.spop(redis_http_usable)
-        for proxy in self._redis.sscan_iter(redis_http):
-            pipe.smove(redis_http, redis_http_usable, proxy)
-        for i in range(self._redis.scard(redis_https_usable)):
-            pipe.spop(redis_https_usable)
-        for proxy in self._redis.sscan_iter(redis_https):
-            pipe.smove(redis_https, redis_https_usable, proxy)
-        pipe.execute()
-
     def check_enough(self):
-        http_enough = self._redis.scard(redis_http) < cache_http_number
-        https_enough = self._redis.scard(redis_https) < cache_https_number
+        http_enough = self._redis.zcard(redis_http_usable) < cache_http_number
+        https_enough = self._redis.zcard(redis_https_usable) < cache_https_number
         return http_enough or https_enough
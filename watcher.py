@@ -0,0 +1,103 @@
+# coding=utf-8
+
+"""可用代理更新通知的监听。
+
+检查器更新可用代理后会增加版本号并在redis频道上发布通知，监听器在后台线程中订阅该频道，收到通知后执行回调并唤醒等待可用代理的线程。
+为防止遗漏通知（如订阅连接断开），没有收到通知时也会定期检查版本号。
+"""
+
+import time
+import logging
+import threading
+
+import redis
+
+from .utils import get_redis, redis_pool_version, redis_pool_channel, pool_check_interval
+
+
+class PoolWatcher:
+    def __init__(self, check_interval=pool_check_interval):
+        """初始化监听器。
+
+        :param check_interval: 没有收到更新通知时检查版本号的间隔，单位秒。
+        """
+        self._redis = get_redis()
+        self._check_interval = check_interval
+        self._logger = logging.getLogger('pool.watcher')
+        self._cond = threading.Condition()
+        self._changes = 0  # 本地记录的更新次数
+        self._version = None
+        self._callbacks = []
+        self._stopped = threading.Event()
+        self._worker = None
+
+    @property
+    def changes(self):
+        """监听器启动以来收到的更新次数，配合wait使用。"""
+        return self._changes
+
+    def add_callback(self, callback):
+        """添加可用代理更新后的回调，回调在监听线程中执行。"""
+        self._callbacks.append(callback)
+
+    def start(self):
+        """启动后台线程监听更新通知。"""
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self._listen)
+        self._worker.setDaemon(True)
+        self._worker.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._worker:
+            self._worker.join()
+
+    def wait(self, changes, timeout=None):
+        """阻塞直到更新次数不等于changes。
+
+        调用方应先读取changes属性，再检查可用代理，检查失败后调用本方法，这样两步之间发生的更新不会被遗漏。
+
+        :param changes: 调用方上次读取的更新次数。
+        :param timeout: 最长等待时间，单位秒，为None时一直等待。
+        :return: 是否发生了更新。
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._changes != changes, timeout)
+
+    def _check_version(self, notified):
+        version = self._redis.get(redis_pool_version)
+        if not notified and version == self._version:
+            return
+
+        self._version = version
+        for callback in self._callbacks:
+            callback()
+
+        with self._cond:
+            self._changes += 1
+            self._cond.notify_all()
+
+    def _listen(self):
+        """后台线程，收到更新通知或等待超过check_interval秒后检查版本号。"""
+        pubsub = None
+        last_check = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(redis_pool_channel)
+                    # 订阅之前可能已经错过了通知
+                    self._check_version(False)
+
+                # 每次最多等待1s，以便及时响应stop
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None or time.monotonic() - last_check >= self._check_interval:
+                    self._check_version(message is not None)
+                    last_check = time.monotonic()
+            except redis.exceptions.RedisError:
+                self._logger.warning('pool watcher error, retry later', exc_info=True)
+                pubsub = None
+                self._stopped.wait(self._check_interval)
+
+        if pubsub is not None:
+            pubsub.close()
@@ -0,0 +1,84 @@
+# coding=utf-8
+
+"""代理网站的产出统计。
+
+按代理网站和页码记录解析出的代理数、验证通过和失败的代理数、验证通过代理的响应时间之和，以及抓取该网站花费的时间。
+检查器按单位抓取时间内验证通过的代理数对网站排序，补充代理时优先抓取产出快的网站。
+"""
+
+from .utils import get_redis, redis_source_prefix
+
+
+class SourceStats:
+    def __init__(self, name):
+        """
+        :param name: 代理网站名称，即解析器的name属性。
+        """
+        self.name = name
+        self._redis = get_redis()
+        self._key = '{}:{}'.format(redis_source_prefix, name)
+        self._pages_key = '{}:pages'.format(self._key)
+
+    def record_parsed(self, page, count):
+        """记录某页解析出的代理数。"""
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hincrby(self._key, 'parsed', count)
+        pipe.hincrby(self._pages_key, '{}:parsed'.format(page), count)
+        pipe.execute()
+
+    def record_result(self, page, latency):
+        """记录某页一个代理的验证结果。
+
+        :param latency: 验证通过时为响应时间，单位毫秒；验证失败时为None。
+        """
+        field = 'failed' if latency is None else 'passed'
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hincrby(self._key, field, 1)
+        pipe.hincrby(self._pages_key, '{}:{}'.format(page, field), 1)
+        if latency is not None:
+            pipe.hincrbyfloat(self._key, 'latency_total', latency)
+        pipe.execute()
+
+    def record_crawl_time(self, seconds):
+        """记录一轮抓取花费的时间，单位秒。"""
+        self._redis.hincrbyfloat(self._key, 'crawl_seconds', seconds)
+
+    def summary(self):
+        """返回网站的产出统计。
+
+        :return: 字典，包括parsed、passed、failed、crawl_seconds，以及yield（验证通过的代理占解析出代理的比例）、
+            latency（验证通过代理的平均响应时间）和rate（每秒抓取时间验证通过的代理数），没有数据的项为None。
+        """
+        raw = {k.decode(): float(v) for k, v in self._redis.hgetall(self._key).items()}
+        parsed, passed = raw.get('parsed', 0), raw.get('passed', 0)
+        crawl_seconds = raw.get('crawl_seconds', 0)
+        return {
+            'parsed': int(parsed),
+            'passed': int(passed),
+            'failed': int(raw.get('failed', 0)),
+            'crawl_seconds': crawl_seconds,
+            'yield': passed / parsed if parsed else None,
+            'latency': raw.get('latency_total', 0) / passed if passed else None,
+            'rate': passed / crawl_seconds if crawl_seconds else None,
+        }
+
+    def pages(self):
+        """返回各页的产出统计，{页码: {'parsed': n, 'passed': n, 'failed': n}}。"""
+        pages = {}
+        for field, value in self._redis.hgetall(self._pages_key).items():
+            page, _, name = field.decode().partition(':')
+            pages.setdefault(int(page), {'parsed': 0, 'passed': 0, 'failed': 0})[name] = int(value)
+        return dict(sorted(pages.items()))
+
+
+def rank_sources(names):
+    """按历史产出速度从快到慢排列代理网站，没有抓取记录的网站排在最前，以便积累统计。
+
+    :param names: 代理网站名称列表。
+    :return: 排序后的名称列表。
+    """
+    def key(name):
+        rate = SourceStats(name).summary()['rate']
+        return float('inf') if rate is None else rate
+
+    return sorted(names, key=key, reverse=True)